@@ -0,0 +1,578 @@
+#!/bin/python
+
+# Замеры производительности без обращения к живым сайтам. Страницы берутся
+# из записанных образцов в benchmark_fixtures: по списку и по одной вакансии
+# на каждый источник. В репозитории лежат синтетические образцы, повторяющие
+# разметку сайтов, записать настоящие можно командой record.
+#   parsers  - скорость разбора страниц, каждым бэкендом, где их несколько
+#   pipeline - весь сбор данных источника против локального сервера-заглушки
+#   db       - запись выборки в бд и поиск дубликатов на временном файле
+#   queries  - запросы к большой таблице до и после миграции с индексами
+#   table    - расчет разметки и вывод таблицы на разном количестве строк
+#   startup  - время запуска скрипта: vw db и импорт сбора с сайтов
+#   record   - перезаписать образцы страницами с живых сайтов
+import asyncio
+import logging
+import sys
+import aiohttp
+from aiohttp import web
+from argparse import ArgumentParser
+from json import loads, dumps
+from os import devnull, environ
+from random import Random
+from os.path import dirname, join
+from tempfile import TemporaryDirectory
+from datetime import timedelta
+from resource import getrusage, RUSAGE_SELF
+from statistics import quantiles, median
+from subprocess import run, DEVNULL, PIPE
+from time import perf_counter
+from requests import get
+from tableprinter import TablePrinter
+from extractors import EXTRACTORS
+from httpclient import ConnectionStats, client_session
+from instrumentation import metrics
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from vacancy_sources import Vacancy, proccess_worker
+from vacancy_db import VacancyDB, Base, db_engine, db_upgrade, db_writer, db_reader, db_search, links_known
+
+fixtures_dir = join(dirname(__file__), 'benchmark_fixtures')
+script = join(dirname(__file__), 'vacancy_watcher_async.py')
+# сколько может занимать запуск vw db
+startup_target_ms = 150
+# модули сбора с сайтов, которые чтению из бд не нужны
+heavy_modules = ('aiohttp', 'requests', 'bs4', 'lxml', 'dateutil', 'multiprocessing')
+# настоящие адреса источников, до подмены заглушкой. Они же
+# в записанных страницах заменяются на адрес заглушки
+real_hosts = dict(Vacancy.hosts)
+# файлы образцов: источник -> (список, вакансия)
+fixture_files = {
+    'hh': ('hh_listing.html', 'hh_detail.html'),
+    'superjob': ('superjob_listing.html', 'superjob_detail.html'),
+    'trudkirov': ('trudkirov_listing.html', 'trudkirov_detail.html'),
+    'trudvsem': ('trudvsem_listing.json', 'trudvsem_detail.json')
+}
+# метод получения данных для каждого источника
+source_methods = {
+    'hh': Vacancy.get_hh_intermediate_data,
+    'superjob': Vacancy.get_superjob_intermediate_data,
+    'trudkirov': Vacancy.get_trudkirov_intermediate_data,
+    'trudvsem': Vacancy.get_trudvsem_intermediate_data
+}
+
+def load_fixture(name: str) -> str:
+    with open(join(fixtures_dir, name), encoding='utf-8') as file:
+        return file.read()
+
+def percentiles(samples: list[float]) -> tuple[float, float]:
+    """p50 и p99 в миллисекундах"""
+    if len(samples) < 2:
+        return (samples[0] * 1000, samples[0] * 1000) if samples else (0.0, 0.0)
+    cuts = quantiles(samples, n=100, method='inclusive')
+    return cuts[49] * 1000, cuts[98] * 1000
+
+def peak_rss() -> float:
+    """Пиковое потребление памяти процессом в мегабайтах (ru_maxrss в Linux - килобайты)"""
+    return getrusage(RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(parse, repeat: int) -> tuple[list[float], object]:
+    """Прогоняет разбор repeat раз, возвращает время каждого прогона и последний результат"""
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        result = parse()
+        timings.append(perf_counter() - started)
+    return timings, result
+
+def bench_parsers(repeat: int) -> list[dict]:
+    """Замеряет разбор каждой страницы-образца. Для источников с несколькими
+    бэкендами замеряется каждый, и результаты сверяются с BeautifulSoup"""
+    listing = { source: load_fixture(files[0]) for source, files in fixture_files.items() }
+    detail = { source: load_fixture(files[1]) for source, files in fixture_files.items() }
+    cases = []
+    for backend in EXTRACTORS:
+        cases += [
+            ('hh', 'список', backend, lambda b=backend: Vacancy._extract_hh_page(EXTRACTORS[b], listing['hh'])),
+            ('hh', 'вакансия', backend, lambda b=backend: Vacancy._extract_hh_detail(EXTRACTORS[b], detail['hh'])),
+            ('superjob', 'список', backend, lambda b=backend: Vacancy._extract_superjob_page(EXTRACTORS[b], listing['superjob'], 1)),
+            ('superjob', 'вакансия', backend, lambda b=backend: Vacancy._extract_superjob_detail(EXTRACTORS[b], detail['superjob'])),
+        ]
+    cases += [
+        ('trudkirov', 'список', 'soup', lambda: Vacancy._parse_trudkirov_page(listing['trudkirov'])),
+        ('trudkirov', 'вакансия', 'soup', lambda: Vacancy._parse_detail('trudkirov', detail['trudkirov'], '')),
+        ('trudvsem', 'список', 'json', lambda: Vacancy._parse_trudvsem_page(loads(listing['trudvsem']))),
+        ('trudvsem', 'вакансия', 'json', lambda: Vacancy._parse_detail('trudvsem', detail['trudvsem'], '')),
+    ]
+    rows = []
+    reference = {}
+    for source, kind, backend, parse in cases:
+        timings, result = measure(parse, repeat)
+        # вакансии сравниваем по содержимому
+        result = [ item.asdict() for item in result ] if isinstance(result, list) else result
+        if backend == 'soup':
+            reference[source, kind] = result
+        p50, p99 = percentiles(timings)
+        total = sum(timings)
+        rows.append({
+            'источник': source,
+            'страница': kind,
+            'бэкенд': backend,
+            'стр/с': f'{repeat / total:.0f}',
+            'вакансий/с': f'{repeat * (len(result) if isinstance(result, list) else 1) / total:.0f}',
+            'p50 мс': f'{p50:.2f}',
+            'p99 мс': f'{p99:.2f}',
+            'как у bs4': '' if backend != 'lxml' else ('да' if reference.get((source, kind)) == result else 'НЕТ'),
+            'RSS МБ': f'{peak_rss():.0f}'
+        })
+    return rows
+
+class StandIn:
+    """Локальный сервер, который отдает образцы страниц вместо сайтов-источников.
+    Каждый источник живет под своим префиксом пути, списки отдаются pages
+    страниц, дальше - пустые, как у настоящих сайтов. Доля errors ответов -
+    503, а доля slow отвечает на slow_delay секунд дольше, как живой сайт.
+    На долю drops запросов подробных данных соединение рвется без ответа"""
+
+    def __init__(self, pages: int, delay: float, errors: float = 0.0, slow: float = 0.0, slow_delay: float = 1.0, drops: float = 0.0) -> None:
+        self.pages = pages
+        self.delay = delay
+        self.errors = errors
+        self.drops = drops
+        self.slow = slow
+        self.slow_delay = slow_delay
+        # сбои по одному и тому же сценарию от прогона к прогону
+        self.random = Random(1)
+        self.requests = 0
+        self.base = ''
+        self.fixtures = {}
+
+    def _body(self, name: str) -> str:
+        """Образец, в котором настоящие адреса источников заменены адресом заглушки"""
+        if name not in self.fixtures:
+            body = load_fixture(name)
+            for host, url in real_hosts.items():
+                body = body.replace(url, f'{self.base}/{host}')
+            self.fixtures[name] = body
+        return self.fixtures[name]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.random.random() < self.errors:
+            return web.Response(status=503)
+        await asyncio.sleep(self.delay + (self.slow_delay if self.random.random() < self.slow else 0))
+        host, path = request.match_info['host'], '/' + request.match_info['path']
+        page = int(request.query.get('page', 0))
+        match host:
+            case 'hh' if path.startswith('/search/vacancy'):
+                body = self._body(fixture_files['hh'][0]) if page < self.pages else '<html><body></body></html>'
+            case 'superjob' if path.startswith('/vakansii/it-internet-svyaz-telekom'):
+                # у superjob страницы нумеруются с единицы
+                body = self._body(fixture_files['superjob'][0]) if page <= self.pages else '<html><body></body></html>'
+            case 'trudkirov' if path == '/vacancy/':
+                body = self._body(fixture_files['trudkirov'][0])
+            case 'trudvsem' if path.startswith('/iblocks/'):
+                listing = loads(self._body(fixture_files['trudvsem'][0]))
+                listing['result']['paging']['pages'] = self.pages
+                if page >= self.pages:
+                    listing['result']['data'] = []
+                return web.json_response(listing)
+            # списки разобраны выше, дальше - только подробные данные
+            case _ if self.drops and (host == 'trudvsem_api' or host in fixture_files) and self.random.random() < self.drops:
+                request.transport.close()
+                return web.Response(status=500)
+            case 'trudvsem_api':
+                return web.Response(text=self._body(fixture_files['trudvsem'][1]), content_type='application/json')
+            case _ if host in fixture_files:
+                body = self._body(fixture_files[host][1])
+            case _:
+                return web.Response(status=404)
+        return web.Response(text=body, content_type='text/html')
+
+    async def start(self) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_get('/{host}/{path:.*}', self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        self.base = f'http://127.0.0.1:{port}'
+        # источники теперь ходят в заглушку
+        for host in real_hosts:
+            Vacancy.hosts[host] = f'{self.base}/{host}'
+        return runner
+
+async def bench_pipeline(pages: int, delay: float, unlimited: bool, stand_in: StandIn | None = None) -> list[dict]:
+    """Прогоняет сбор данных каждого источника целиком - списки и подробные
+    данные - против заглушки. С unlimited ограничитель частоты не сдерживает запросы.
+    Неполные - вакансии, для которых так и не получены подробные данные"""
+    stand_in = stand_in or StandIn(pages, delay)
+    runner = await stand_in.start()
+    if unlimited:
+        # снимаем ограничения частоты, чтобы мерить сам конвейер, а не ограничитель
+        for limits in Vacancy.detail_limits.values():
+            limits.update(rate=10000, burst=1000, min_concurrency=limits['max_concurrency'])
+    latencies = []
+    async def on_request_start(session, context, params) -> None:
+        context.started = perf_counter()
+    async def on_request_end(session, context, params) -> None:
+        latencies.append(perf_counter() - context.started)
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    rows = []
+    try:
+        for source, method in source_methods.items():
+            latencies.clear()
+            served = stand_in.requests
+            stats = ConnectionStats()
+            async with client_session(stats, [trace]) as session:
+                started = perf_counter()
+                vacancies = await proccess_worker(method, 1, session)
+                elapsed = perf_counter() - started
+            p50, p99 = percentiles(latencies)
+            rows.append({
+                'источник': source,
+                'вакансий': len(vacancies),
+                'неполных': sum(not item.fulldesc for item in vacancies),
+                # без даты вакансию не записать в бд, таких быть не должно
+                'без даты': sum(not item.date for item in vacancies),
+                'запросов': stand_in.requests - served,
+                'стр/с': f'{(stand_in.requests - served) / elapsed:.0f}',
+                'вакансий/с': f'{len(vacancies) / elapsed:.0f}',
+                'p50 мс': f'{p50:.1f}',
+                'p99 мс': f'{p99:.1f}',
+                'соединений': stats.connections,
+                'переисп.': stats.reused,
+                'время с': f'{elapsed:.2f}',
+                'RSS МБ': f'{peak_rss():.0f}'
+            })
+    finally:
+        await runner.cleanup()
+        Vacancy.hosts.update(real_hosts)
+        Vacancy.close_parse_pool()
+    return rows
+
+def synthetic_vacancies(amount: int, days: int) -> list[Vacancy]:
+    """Вакансии, похожие на настоящие по размеру полей, с датами вразброс за days дней"""
+    return [
+        Vacancy(
+            source_type = 'hh',
+            title = f'Программист {number}',
+            link = f'{real_hosts["hh"]}/vacancy/{number}',
+            company = f'ООО Компания {number % 500}',
+            salary = f'от {30000 + number % 100 * 1000} ₽',
+            shortdesc = 'Разработка и поддержка внутренних сервисов. ' * 4,
+            date = Vacancy.date_now - timedelta(days=number % days),
+            experience = '1–3 года',
+            fulldesc = 'Обязанности, требования и условия работы. ' * 40
+        )
+        for number in range(amount)
+    ]
+
+def bench_db(amount: int, days: int) -> list[dict]:
+    """Записывает amount вакансий в пустую бд через db_writer, затем
+    пишет их же повторно - тогда все они должны отсеяться как дубликаты.
+    Отдельно выводится, сколько из времени записи заняли подписи MinHash
+    и поиск почти дубликатов"""
+    vacancies = synthetic_vacancies(amount, days)
+    source = vacancies[0].source_type
+    rows = []
+    with TemporaryDirectory() as tmp_dir:
+        engine = db_engine(join(tmp_dir, 'vacancy.db'))
+        Base.metadata.create_all(engine)
+        db_upgrade(engine)
+        with Session(engine) as session:
+            for stage in ('запись', 'повтор'):
+                metrics.forget(source)
+                started = perf_counter()
+                written = db_writer(vacancies, session)
+                elapsed = perf_counter() - started
+                _, clustering, _ = metrics.timings.get((source, 'cluster'), (0, 0.0, 0.0))
+                rows.append({
+                    'этап': stage,
+                    'вакансий': amount,
+                    'записано': len(written),
+                    'время мс': f'{elapsed * 1000:.1f}',
+                    'из них кластеры мс': f'{clustering * 1000:.1f}',
+                    'строк/с': f'{amount / elapsed:.0f}',
+                    'RSS МБ': f'{peak_rss():.0f}'
+                })
+        engine.dispose()
+    return rows
+
+# таблица вакансий в том виде, в каком её создавала первая версия скрипта
+baseline_schema = (
+    'CREATE TABLE vacancies (id INTEGER NOT NULL, source_type VARCHAR NOT NULL, title VARCHAR NOT NULL, '
+    'company VARCHAR NOT NULL, salary VARCHAR, shortdesc VARCHAR, link VARCHAR NOT NULL, date DATE NOT NULL, '
+    'experience VARCHAR, fulldesc VARCHAR, PRIMARY KEY (id))'
+)
+
+def fill_table(session: Session, amount: int) -> None:
+    """Заполняет таблицу amount короткими вакансиями за год, пачками
+    через executemany. Каждая сотая ссылка повторяется в разные дни.
+    Заполняются только колонки первой версии, остальное - дело миграций"""
+    columns = ('source_type', 'title', 'company', 'salary', 'shortdesc', 'link', 'date', 'experience', 'fulldesc')
+    statement = text(f'INSERT INTO vacancies ({", ".join(columns)}) VALUES ({", ".join(":" + column for column in columns)})')
+    sources = list(fixture_files)
+    for batch_start in range(0, amount, 50000):
+        batch = []
+        for number in range(batch_start, min(amount, batch_start + 50000)):
+            row = {
+                'source_type': sources[number % len(sources)],
+                'title': f'Вакансия {number}',
+                'company': f'Компания {number % 5000}',
+                'salary': f'{number % 100 * 1000}',
+                'shortdesc': 'Короткое описание',
+                'link': f'{real_hosts["hh"]}/vacancy/{number // 100 if number % 100 == 0 else number}',
+                'date': Vacancy.date_now - timedelta(days=number % 365),
+                'experience': '',
+                'fulldesc': 'Полное описание'
+            }
+            batch.append(row)
+        session.execute(statement, batch)
+        session.commit()
+
+def time_queries(session: Session, amount: int, repeat: int, indexed: bool) -> dict:
+    """Медианное время типовых запросов скрипта в миллисекундах. Поиск
+    по словам без полнотекстового индекса делается через LIKE"""
+    word = str(amount // 3)
+    if indexed:
+        search = lambda: db_search(word, session).all()
+    else:
+        search = lambda: session.execute(select(VacancyDB.id).where(
+            VacancyDB.title.contains(word) | VacancyDB.shortdesc.contains(word) | VacancyDB.fulldesc.contains(word))).all()
+    probe = [ VacancyDB.make_fingerprint({'title': f'нет такой {number}'}) for number in range(500) ]
+    # страница списка: 20 вакансий из середины таблицы
+    page = [ Vacancy('hh', 'Вакансия', f'{real_hosts["hh"]}/vacancy/{amount // 2 + number}', salary='1000') for number in range(1, 21) ]
+    queries = {
+        'db_reader, сутки': lambda: db_reader(1, session).all(),
+        'источник за неделю': lambda: session.execute(select(VacancyDB.id).where(
+            VacancyDB.source_type == 'hh', VacancyDB.date >= Vacancy.date_now - timedelta(days=7))).all(),
+        'links_known, страница': lambda: links_known(page, session),
+        'дубликаты, 500 отпечатков': lambda: session.scalars(select(VacancyDB.fingerprint).where(VacancyDB.fingerprint.in_(probe))).all(),
+        'поиск по слову': search
+    }
+    result = {}
+    for name, query in queries.items():
+        timings, _ = measure(query, repeat)
+        result[name] = percentiles(timings)[0]
+        session.expunge_all()
+    return result
+
+def db_schema(session: Session) -> dict:
+    """Схема бд для сравнения: колонки каждой таблицы и текст создания
+    индексов и триггеров. Порядок колонок не важен - ALTER TABLE
+    дописывает их в конец"""
+    schema = {}
+    for kind, name, sql in session.execute(text('SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE \'sqlite_%\'')):
+        if kind == 'table':
+            schema[name] = sorted(row[1] for row in session.execute(text(f'PRAGMA table_info("{name}")')))
+        else:
+            schema[name] = sql
+    return schema
+
+def bench_queries(amount: int, repeat: int) -> list[dict]:
+    """Строит таблицу на amount записей в схеме первой версии и проводит
+    все миграции, как на старой бд пользователя. Схема после них должна
+    совпасть со схемой новой бд. Затем замеряет запросы без индексов
+    и поиск без полнотекстового индекса, а после - с ними"""
+    with TemporaryDirectory() as tmp_dir:
+        engine = db_engine(join(tmp_dir, 'fresh.db'))
+        Base.metadata.create_all(engine)
+        db_upgrade(engine)
+        with Session(engine) as session:
+            expected = db_schema(session)
+        engine.dispose()
+        engine = db_engine(join(tmp_dir, 'vacancy.db'))
+        with Session(engine) as session:
+            session.execute(text(baseline_schema))
+            session.commit()
+            fill_table(session, amount)
+        started = perf_counter()
+        db_upgrade(engine)
+        migration = perf_counter() - started
+        with Session(engine) as session:
+            upgraded = db_schema(session)
+            differences = sorted(name for name in expected.keys() | upgraded.keys() if expected.get(name) != upgraded.get(name))
+            # запросы без индексов: индексы снимаются, а потом создаются заново
+            indexes = session.execute(text(
+                f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = '{VacancyDB.__tablename__}' AND sql IS NOT NULL"
+            )).all()
+            for name, _ in indexes:
+                session.execute(text(f'DROP INDEX {name}'))
+            session.commit()
+            before = time_queries(session, amount, repeat, False)
+            for _, sql in indexes:
+                session.execute(text(sql))
+            session.commit()
+            after = time_queries(session, amount, repeat, True)
+        engine.dispose()
+    return [
+        {
+            'запрос': name,
+            'записей': amount,
+            'без индексов мс': f'{before[name]:.2f}',
+            'с индексами мс': f'{after[name]:.2f}',
+            'ускорение': f'{before[name] / after[name]:.0f}x'
+        }
+        for name in before
+    ] + [
+        {'запрос': 'миграция с первой версии', 'записей': amount, 'без индексов мс': '', 'с индексами мс': f'{migration * 1000:.0f}', 'ускорение': ''},
+        {'запрос': 'схема после миграции', 'записей': amount, 'без индексов мс': '', 'ускорение': '',
+         'с индексами мс': 'отличается: ' + ', '.join(differences) if differences else 'совпадает'}
+    ]
+
+def bench_table(amount: int) -> list[dict]:
+    """Разметка (ширины колонок) и полный вывод таблицы в /dev/null на amount
+    строк и на десятой их части - время должно расти линейно"""
+    headers = [('title', 15), ('company', 10), ('salary', 10), 'shortdesc', ('date', 10), ('experience', 5), ('link', 100)]
+    vacancies = [ item.asdict() for item in synthetic_vacancies(amount, 30) ]
+    rows = []
+    with open(devnull, 'w', encoding='utf-8') as sink:
+        for size in (amount // 10, amount):
+            for percentile in (None, 95):
+                printer = TablePrinter(headers, vacancies[:size], header_size_matters=True, width_percentile=percentile)
+                started = perf_counter()
+                printer._get_lengths()
+                layout = perf_counter() - started
+                started = perf_counter()
+                TablePrinter(headers, vacancies[:size], header_size_matters=True, width_percentile=percentile).printer(sink)
+                render = perf_counter() - started
+                rows.append({
+                    'строк': size,
+                    'ширина': 'максимум' if percentile is None else f'p{percentile}',
+                    'разметка мс': f'{layout * 1000:.1f}',
+                    'вывод мс': f'{render * 1000:.0f}',
+                    'строк/с': f'{size / render:.0f}'
+                })
+    return rows
+
+def import_times(command: list[str], cwd: str) -> dict[str, int]:
+    """Запускает python -X importtime с command и отдает собственное время
+    импорта каждого модуля в микросекундах"""
+    result = run([sys.executable, '-X', 'importtime', *command], cwd=cwd, stdout=DEVNULL, stderr=PIPE, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        own, _, name = line.removeprefix('import time:').split('|')
+        # первая строка - заголовок колонок
+        if own.strip().isdigit():
+            times[name.strip()] = int(own)
+    return times
+
+def bench_startup(repeat: int) -> list[dict]:
+    """Запускает repeat раз vw db 1 на бд с table_page_size вакансиями и,
+    для сравнения, пустой интерпретатор и импорт сбора с сайтов. Время
+    импорта и загруженные лишние модули - по отдельному запуску с -X importtime.
+    Вывод не в терминал, ширина таблицы берется из COLUMNS"""
+    commands = {
+        'python': ['-c', 'pass'],
+        'vw db 1': [script, 'db', '1'],
+        'vw search': [script, 'search', '-q', 'программист'],
+        'import vacancy_sources': ['-c', 'import vacancy_sources']
+    }
+    rows = []
+    with TemporaryDirectory() as tmp_dir:
+        engine = db_engine(join(tmp_dir, 'vacancy.db'))
+        Base.metadata.create_all(engine)
+        db_upgrade(engine)
+        with Session(engine) as session:
+            db_writer(synthetic_vacancies(200, 1), session)
+        engine.dispose()
+        environ['COLUMNS'] = '200'
+        environ['PYTHONPATH'] = dirname(script)
+        interpreter = None
+        for name, command in commands.items():
+            samples = []
+            for _ in range(repeat):
+                started = perf_counter()
+                run([sys.executable, *command], cwd=tmp_dir, stdout=DEVNULL, stderr=DEVNULL, check=True)
+                samples.append((perf_counter() - started) * 1000)
+            times = import_times(command, tmp_dir)
+            interpreter = interpreter if interpreter is not None else median(samples)
+            rows.append({
+                'команда': name,
+                'медиана мс': f'{median(samples):.0f}',
+                'мин мс': f'{min(samples):.0f}',
+                'сверх python мс': f'{median(samples) - interpreter:.0f}',
+                'импорт мс': f'{sum(times.values()) / 1000:.0f}',
+                'лишние модули': ' '.join(module for module in heavy_modules if module in times),
+                f'до {startup_target_ms} мс': '' if name != 'vw db 1' else ('да' if median(samples) < startup_target_ms else 'нет')
+            })
+    return rows
+
+def record() -> None:
+    """Записывает образцы с живых сайтов: первую страницу списка и первую
+    вакансию из неё для каждого источника"""
+    listing_requests = {
+        'hh': (Vacancy._hh_url(1, 0), Vacancy.headers['get_hh_intermediate_data'], Vacancy._parse_hh_page),
+        'superjob': (Vacancy._superjob_url(1, 1), Vacancy.headers['get_superjob_intermediate_data'], lambda text: Vacancy._parse_superjob_page(text, 1)),
+        'trudkirov': (Vacancy._trudkirov_url(1), None, Vacancy._parse_trudkirov_page),
+        'trudvsem': (Vacancy._trudvsem_url(1, 0), None, lambda text: Vacancy._parse_trudvsem_page(loads(text)))
+    }
+    for source, (url, headers, parse) in listing_requests.items():
+        page = get(url, headers=headers, timeout=Vacancy.request_timeout)
+        if Vacancy.bad_status_code(page.status_code, f'record {source}', True):
+            continue
+        with open(join(fixtures_dir, fixture_files[source][0]), 'w', encoding='utf-8') as file:
+            file.write(page.text)
+        vacancies = parse(page.text)
+        if not vacancies:
+            print(f'{source}: в списке нет вакансий, страница вакансии не записана')
+            continue
+        detail = get(vacancies[0].detail_link(), headers=headers, timeout=Vacancy.request_timeout)
+        if Vacancy.bad_status_code(detail.status_code, f'record {source}', True):
+            continue
+        with open(join(fixtures_dir, fixture_files[source][1]), 'w', encoding='utf-8') as file:
+            file.write(detail.text)
+        print(f'{source}: записано')
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Замеры производительности разбора и сбора данных на записанных страницах', prog='benchmark')
+    parser.add_argument('mode', choices=['parsers', 'pipeline', 'db', 'queries', 'table', 'startup', 'record'], help='Что замерять')
+    parser.add_argument('--repeat', type=int, default=50, help='Сколько раз разбирать каждую страницу (для startup - запускать каждую команду)')
+    parser.add_argument('--pages', type=int, default=3, help='Сколько страниц списка отдает заглушка')
+    parser.add_argument('--delay', type=float, default=0.0, help='Задержка ответа заглушки в секундах')
+    parser.add_argument('--unlimited', action='store_true', help='Снять ограничения частоты запросов')
+    parser.add_argument('--errors', type=float, default=0.0, help='Доля ответов заглушки со статусом 503')
+    parser.add_argument('--drops', type=float, default=0.0, help='Доля запросов подробных данных, на которые заглушка рвет соединение')
+    parser.add_argument('--slow', type=float, default=0.0, help='Доля ответов заглушки с дополнительной задержкой')
+    parser.add_argument('--slow-delay', type=float, default=1.0, help='Дополнительная задержка медленных ответов в секундах')
+    parser.add_argument('--no-retry', action='store_true', help='Не повторять неудачные запросы')
+    parser.add_argument('--parse-executor', choices=['inline', 'thread', 'process'], default='thread', help='Где разбирать страницы подробных данных')
+    parser.add_argument('--hedge', action='store_true', help='Дублировать медленные запросы подробных данных')
+    parser.add_argument('--rows', type=int, default=5000, help='Сколько вакансий записывать в бд (для queries - сколько записей в таблице)')
+    parser.add_argument('--days', type=int, default=30, help='За сколько дней разбросаны даты вакансий')
+    parser.add_argument('--json', action='store_true', help='Вывести результат в json, а не таблицей')
+    args = parser.parse_args()
+    # предупреждения разбора в консоль, чтобы расхождения не прошли незамеченными
+    logging.basicConfig(level=logging.WARNING)
+    match args.mode:
+        case 'parsers':
+            rows = bench_parsers(args.repeat)
+        case 'pipeline':
+            if args.no_retry:
+                Vacancy.retry_settings = {**Vacancy.retry_settings, 'attempts': 1}
+            Vacancy.hedge_details = args.hedge
+            Vacancy.parse_executor = args.parse_executor
+            stand_in = StandIn(args.pages, args.delay, args.errors, args.slow, args.slow_delay, args.drops)
+            rows = asyncio.run(bench_pipeline(args.pages, args.delay, args.unlimited, stand_in))
+        case 'db':
+            rows = bench_db(args.rows, args.days)
+        case 'queries':
+            rows = bench_queries(args.rows, args.repeat)
+        case 'table':
+            rows = bench_table(args.rows)
+        case 'startup':
+            rows = bench_startup(args.repeat)
+        case 'record':
+            record()
+            rows = None
+    if rows is not None:
+        if args.json:
+            print(dumps(rows, ensure_ascii=False, indent=2))
+        else:
+            TablePrinter(list(rows[0].keys()), rows, header_size_matters=True).printer()
@@ -0,0 +1,50 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import perf_counter
+from typing import Callable, TypeVar
+
+from sqlalchemy.orm import Session
+
+T = TypeVar('T')
+
+# Работа с бд вне цикла событий. Запись выборки вместе с подписями MinHash и
+# кластерами занимает секунды, и все это время цикл стоял бы, а с ним и
+# запросы остальных источников. Сессия бд одна на всех, поэтому поток тоже
+# один: вызовы выполняются строго по очереди, и сессией в каждый момент
+# пользуется только один из них. sqlite отдает соединения пула в любой поток,
+# так что сессию можно создать и в основном потоке
+class DbThread:
+    def __init__(self, session: Session) -> None:
+        self.session = session
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+        # статистика для лога: вызовов и сколько секунд поток был занят
+        self.calls = 0
+        self.busy = 0.0
+
+    def _timed(self, function: Callable[..., T], *args, **kwargs) -> T:
+        started = perf_counter()
+        try:
+            return function(*args, session=self.session, **kwargs)
+        finally:
+            self.calls += 1
+            self.busy += perf_counter() - started
+
+    async def run(self, function: Callable[..., T], *args, **kwargs) -> T:
+        """Выполняет function(*args, session=session, **kwargs) в потоке бд.
+        Если ожидающую корутину отменят, вызов все равно доработает до конца"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(self._timed, function, *args, **kwargs)
+        )
+
+    async def rollback(self) -> None:
+        """Откатывает транзакцию сессии, тоже в потоке бд"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.session.rollback)
+
+    def close(self) -> None:
+        """Дожидается начатых вызовов, сессия после этого снова принадлежит
+        основному потоку"""
+        self._executor.shutdown(wait=True)
+
+    def __repr__(self) -> str:
+        return f'DbThread(calls={self.calls}, busy={self.busy:.2f}s)'
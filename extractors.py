@@ -0,0 +1,157 @@
+from bs4 import BeautifulSoup
+from lxml.html import document_fromstring, HtmlElement
+from lxml.etree import XPath
+
+def _class_token(name: str) -> str:
+    """Условие XPath на наличие класса целиком, как это понимают css и bs4"""
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+# Именованные запросы к странице: css для BeautifulSoup и XPath для lxml.
+# Алгоритм разбора пишется один раз через методы экстрактора, а какой
+# из запросов выполнить - решает выбранный бэкенд
+QUERIES = {
+    # список вакансий hh
+    'hh_card': ('div.serp-item', f'.//div[{_class_token("serp-item")}]'),
+    'hh_link': ('a.bloko-link', f'.//a[{_class_token("bloko-link")}]'),
+    'hh_title': ('a[class*=bloko-link]', './/a[contains(@class, "bloko-link")]'),
+    'hh_salary': ('span[data-qa="vacancy-serp__vacancy-compensation"]', './/span[@data-qa="vacancy-serp__vacancy-compensation"]'),
+    'hh_company': ('div[class*=vacancy-serp-item__meta-info-company]', './/div[contains(@class, "vacancy-serp-item__meta-info-company")]'),
+    'hh_shortdesc': ('div[class*=g-user-content]', './/div[contains(@class, "g-user-content")]'),
+    # страница вакансии hh
+    'hh_experience': ('span[data-qa*=vacancy-experience]', './/span[contains(@data-qa, "vacancy-experience")]'),
+    'hh_fulldesc': ('div[data-qa*=vacancy-description]', './/div[contains(@data-qa, "vacancy-description")]'),
+    'hh_date': ('p[class*=vacancy-creation-time-redesigned] > span', './/p[contains(@class, "vacancy-creation-time-redesigned")]/span'),
+    # список вакансий superjob
+    'sj_card': ('div.f-test-search-result-item', f'.//div[{_class_token("f-test-search-result-item")}]'),
+    'sj_paid': ('div[style*=background-colo]', './/div[contains(@style, "background-colo")]'),
+    'sj_span': ('span', './/span'),
+    'sj_city': ('span[class*=f-test-text-company-item-location]', './/span[contains(@class, "f-test-text-company-item-location")]'),
+    'sj_link': ('a', './/a'),
+    'sj_salary': ('div[class*=f-test-text-company-item-salary]', './/div[contains(@class, "f-test-text-company-item-salary")]'),
+    'sj_company': ('span[class*=f-test-text-vacancy-item-company-name]', './/span[contains(@class, "f-test-text-vacancy-item-company-name")]'),
+    'sj_button': ('button.f-test-button-Otkliknutsya', f'.//button[{_class_token("f-test-button-Otkliknutsya")}]'),
+    'sj_badge': ('span.f-test-badge', f'.//span[{_class_token("f-test-badge")}]'),
+    # страница вакансии superjob
+    'sj_address': ('div.f-test-address', f'.//div[{_class_token("f-test-address")}]'),
+    'sj_base_info': ('div.f-test-vacancy-base-info', f'.//div[{_class_token("f-test-vacancy-base-info")}]'),
+}
+
+# Бэкенд на BeautifulSoup. Строит полное дерево, зато эталон по поведению
+class SoupExtractor:
+    name = 'soup'
+
+    def document(self, text: str) -> BeautifulSoup:
+        return BeautifulSoup(text, 'lxml')
+
+    def find_all(self, node: BeautifulSoup, query: str) -> list:
+        return node.select(QUERIES[query][0])
+
+    def find(self, node: BeautifulSoup, query: str) -> BeautifulSoup | None:
+        return node.select_one(QUERIES[query][0])
+
+    def text(self, node: BeautifulSoup | str) -> str:
+        return node.getText()
+
+    def text_or_empty(self, node: BeautifulSoup, query: str) -> str:
+        """Текст первого найденного элемента, или пустая строка"""
+        return tmp.getText() if (tmp := node.select_one(QUERIES[query][0])) else ''
+
+    def attr(self, node: BeautifulSoup, name: str) -> str:
+        return node.attrs[name]
+
+    def parent(self, node: BeautifulSoup) -> BeautifulSoup:
+        return node.parent
+
+    def previous_sibling(self, node: BeautifulSoup) -> BeautifulSoup:
+        # может оказаться и строкой, с которой дальше ничего не найти
+        return node.previousSibling
+
+    def next_sibling(self, node: BeautifulSoup) -> BeautifulSoup | str | None:
+        """Следующий сосед, тег или текст"""
+        return node.next_sibling
+
+    def contents(self, node: BeautifulSoup) -> list:
+        """Дети элемента вместе с текстом между ними"""
+        return node.contents
+
+# Бэкенд на lxml.html с заранее скомпилированными XPath. Дерево у lxml
+# строится на C и заметно быстрее, а текст собирается так же, как у bs4
+class LxmlExtractor:
+    name = 'lxml'
+    # содержимое этих тегов BeautifulSoup не считает текстом
+    skipped_tags = frozenset(('script', 'style', 'template', 'rt', 'rp'))
+
+    def __init__(self) -> None:
+        self._all = { name: XPath(xpath) for name, (_, xpath) in QUERIES.items() }
+        self._first = { name: XPath(f'({xpath})[1]') for name, (_, xpath) in QUERIES.items() }
+
+    def document(self, text: str) -> HtmlElement:
+        return document_fromstring(text)
+
+    def find_all(self, node: HtmlElement, query: str) -> list:
+        return self._all[query](node)
+
+    def find(self, node: HtmlElement, query: str) -> HtmlElement | None:
+        return found[0] if (found := self._first[query](node)) else None
+
+    def text(self, node: HtmlElement | str) -> str:
+        """Текст элемента со всеми потомками, без комментариев и
+        содержимого skipped_tags - как getText у BeautifulSoup. Текст
+        между элементами (next_sibling, contents) и есть текст"""
+        if isinstance(node, str):
+            return node
+        parts = []
+        def walk(element: HtmlElement) -> None:
+            if element.text:
+                parts.append(element.text)
+            for child in element:
+                # комментарии в lxml тоже элементы, но с тегом-функцией
+                if isinstance(child.tag, str) and child.tag not in self.skipped_tags:
+                    walk(child)
+                if child.tail:
+                    parts.append(child.tail)
+        walk(node)
+        return ''.join(parts)
+
+    def text_or_empty(self, node: HtmlElement, query: str) -> str:
+        """Текст первого найденного элемента, или пустая строка"""
+        return self.text(tmp) if (tmp := self.find(node, query)) is not None else ''
+
+    def attr(self, node: HtmlElement, name: str) -> str:
+        return node.attrib[name]
+
+    def parent(self, node: HtmlElement) -> HtmlElement:
+        return node.getparent()
+
+    def previous_sibling(self, node: HtmlElement) -> HtmlElement:
+        # у bs4 предыдущим соседом может оказаться текст или комментарий, и дальнейший
+        # поиск в нем падает с AttributeError. Повторяем это, чтобы результаты совпадали
+        previous = node.getprevious()
+        text_before = previous.tail if previous is not None else node.getparent().text
+        if text_before or previous is None or not isinstance(previous.tag, str):
+            raise AttributeError('предыдущий сосед элемента - не тег')
+        return previous
+
+    def next_sibling(self, node: HtmlElement) -> HtmlElement | str | None:
+        """Следующий сосед, как у bs4: текст после элемента, если он есть, иначе тег"""
+        if node.tail:
+            return node.tail
+        following = node.getnext()
+        if following is not None and not isinstance(following.tag, str):
+            # комментарий bs4 тоже отдает строкой
+            return following.text or ''
+        return following
+
+    def contents(self, node: HtmlElement) -> list:
+        """Дети элемента вместе с текстом между ними, как contents у bs4"""
+        parts = [node.text] if node.text else []
+        for child in node:
+            parts.append(child if isinstance(child.tag, str) else child.text or '')
+            if child.tail:
+                parts.append(child.tail)
+        return parts
+
+EXTRACTORS = {
+    'soup': SoupExtractor(),
+    'lxml': LxmlExtractor()
+}
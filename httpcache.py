@@ -0,0 +1,132 @@
+import sqlite3
+import zlib
+from threading import Lock
+from time import time
+
+# Запись кэша: тело страницы и валидаторы, по которым сервер может ответить 304
+class CachedPage:
+
+    def __init__(self, body: str, etag: str | None, last_modified: str | None, stored_at: float) -> None:
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+
+    def is_fresh(self, ttl: int) -> bool:
+        """Свежая запись отдается без обращения к серверу вовсе"""
+        return time() - self.stored_at < ttl
+
+    def conditional_headers(self) -> dict:
+        """Заголовки условного запроса. Если страница не менялась,
+        сервер ответит 304 без тела"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+# Постоянный http кэш в отдельном файле sqlite. Тела хранятся сжатыми,
+# общий размер ограничен, при превышении выкидываются давно не читанные записи.
+# Методы блокирующие, асинхронный код зовет их через asyncio.to_thread, так
+# что соединение общее для потоков, а обращения к нему идут под блокировкой.
+# Время обращения к записям нужно только для очистки, поэтому оно копится
+# в памяти и пишется в файл вместе с очередным сохранением или очисткой,
+# а не отдельной транзакцией на каждое попадание
+class HttpCache:
+    # через сколько сохранений проверять, не пора ли чистить кэш
+    evict_every = 100
+
+    def __init__(self, path: str = 'http_cache.db', max_size: int = 100 * 1024 * 1024) -> None:
+        # максимальный суммарный размер сжатых тел в байтах
+        self.max_size = max_size
+        self._stores = 0
+        # url -> когда к записи обращались, еще не записанное в файл
+        self._accessed = {}
+        self._lock = Lock()
+        # с файлом могут работать сразу несколько процессов, поэтому WAL и ожидание блокировки
+        self._connection = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'url TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL, etag TEXT, '
+            'last_modified TEXT, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS ix_pages_accessed_at ON pages (accessed_at)')
+        self._connection.commit()
+        # статистика для лога
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def lookup(self, url: str) -> CachedPage | None:
+        """Ищет страницу в кэше, отмечая обращение к ней"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT body, etag, last_modified, stored_at FROM pages WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._accessed[url] = time()
+        body, etag, last_modified, stored_at = row
+        return CachedPage(zlib.decompress(body).decode(), etag, last_modified, stored_at)
+
+    def store(self, url: str, body: str, etag: str | None, last_modified: str | None) -> None:
+        """Сохраняет или перезаписывает страницу"""
+        compressed = zlib.compress(body.encode())
+        now = time()
+        with self._lock:
+            self._accessed.pop(url, None)
+            self._connection.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, compressed, len(compressed), etag, last_modified, now, now)
+            )
+            self._write_accessed()
+            self._connection.commit()
+            self._stores += 1
+            if self._stores % self.evict_every == 0:
+                self._evict()
+
+    def refresh(self, url: str) -> None:
+        """Сервер подтвердил (304), что страница не менялась - она снова свежая"""
+        with self._lock:
+            self._connection.execute('UPDATE pages SET stored_at = ? WHERE url = ?', (time(), url))
+            self._write_accessed()
+            self._connection.commit()
+
+    def _write_accessed(self) -> None:
+        """Дописывает накопленное время обращений в текущую транзакцию"""
+        if self._accessed:
+            self._connection.executemany(
+                'UPDATE pages SET accessed_at = ? WHERE url = ?', [ (accessed, url) for url, accessed in self._accessed.items() ]
+            )
+            self._accessed.clear()
+
+    def evict(self) -> None:
+        """Удаляет давно не читанные записи, пока размер кэша не уложится в max_size"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        self._write_accessed()
+        self._connection.commit()
+        total = self._connection.execute('SELECT coalesce(sum(size), 0) FROM pages').fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = self._connection.execute('SELECT url, size FROM pages ORDER BY accessed_at')
+        outdated = []
+        for url, size in rows:
+            if total <= self.max_size:
+                break
+            outdated.append((url,))
+            total -= size
+        self._connection.executemany('DELETE FROM pages WHERE url = ?', outdated)
+        self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._evict()
+            self._connection.close()
+
+    def __repr__(self) -> str:
+        return f'HttpCache(hits={self.hits}, revalidated={self.revalidated}, misses={self.misses})'
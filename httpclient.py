@@ -0,0 +1,86 @@
+import aiohttp
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+# Общие настройки http клиентов. Соединения держатся открытыми и
+# переиспользуются между страницами списка и подробных данных, так что
+# TLS рукопожатие с хостом происходит единожды, а не на каждый запрос
+
+# всего соединений у сессии и к одному хосту. К хосту с подробными данными
+# больше HostLimiter.max_concurrency запросов разом все равно не уходит,
+# плюс несколько страниц списка, запрошенных наперед
+connection_limit = 100
+connection_limit_per_host = 24
+# сколько секунд помнить адреса хостов и держать простаивающее соединение
+dns_cache_ttl = 300
+keepalive_timeout = 30
+# сжатие ответа, разжимают его оба клиента сами
+accept_encoding = 'gzip, deflate'
+
+# Счетчики соединений для лога: сколько запросов ушло, сколько для них
+# открыто новых соединений (с https - это и TLS рукопожатия), сколько раз
+# соединение взято из пула, и как отработал кэш DNS
+class ConnectionStats:
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.connections = 0
+        self.reused = 0
+        self.dns_hits = 0
+        self.dns_misses = 0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Настройка трассировки aiohttp, которая ведет эти счетчики"""
+        def counter(name: str):
+            async def increment(session, context, params) -> None:
+                setattr(self, name, getattr(self, name) + 1)
+            return increment
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(counter('requests'))
+        trace.on_connection_create_end.append(counter('connections'))
+        trace.on_connection_reuseconn.append(counter('reused'))
+        trace.on_dns_cache_hit.append(counter('dns_hits'))
+        trace.on_dns_cache_miss.append(counter('dns_misses'))
+        return trace
+
+    def add_sync(self, session: Session) -> None:
+        """Добавляет счетчики пулов синхронной сессии requests. У нее трассировки
+        нет, зато пулы urllib3 сами считают запросы и открытые соединения.
+        Один адаптер может обслуживать и http, и https"""
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                self.requests += pool.num_requests
+                self.connections += pool.num_connections
+                self.reused += pool.num_requests - pool.num_connections
+
+    def __repr__(self) -> str:
+        return (f'ConnectionStats(requests={self.requests}, connections={self.connections}, '
+                f'reused={self.reused}, dns_hits={self.dns_hits}, dns_misses={self.dns_misses})')
+
+def client_session(stats: ConnectionStats | None = None, trace_configs: list[aiohttp.TraceConfig] | None = None) -> aiohttp.ClientSession:
+    """Асинхронная сессия с общими настройками пула соединений. Создается
+    внутри работающего цикла событий. stats, если передан, считает соединения"""
+    connector = aiohttp.TCPConnector(
+        limit=connection_limit,
+        limit_per_host=connection_limit_per_host,
+        ttl_dns_cache=dns_cache_ttl,
+        keepalive_timeout=keepalive_timeout
+    )
+    trace_configs = list(trace_configs or [])
+    if stats is not None:
+        trace_configs.append(stats.trace_config())
+    return aiohttp.ClientSession(
+        connector=connector, headers={'Accept-Encoding': accept_encoding}, trace_configs=trace_configs
+    )
+
+def sync_session() -> Session:
+    """Синхронная сессия requests для тех же хостов. В отличие от голого
+    requests.get держит соединения открытыми между запросами"""
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=connection_limit // connection_limit_per_host, pool_maxsize=connection_limit_per_host)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = accept_encoding
+    return session
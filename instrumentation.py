@@ -0,0 +1,177 @@
+from contextlib import contextmanager
+from datetime import datetime
+from json import dumps
+from os import replace
+from time import monotonic, perf_counter, time
+from typing import Iterator
+
+# Метрики одного прогона: сколько раз и сколько времени заняли этапы
+# по каждому источнику, сколько байт получено, как менялась очередь
+# подробных данных и насколько были заняты её потребители. Этапы идут
+# параллельно, поэтому их время в сумме может быть больше времени прогона
+class Metrics:
+    # этапы в порядке прохождения, для сводки. parse_wait - сколько страницы
+    # ждали свободного потока или процесса разбора, cluster - подписи MinHash
+    # и поиск почти дубликатов при записи, в db_write оно не входит
+    stages = ('listing_fetch', 'listing_parse', 'detail_fetch', 'parse_wait', 'detail_parse', 'dedup', 'db_write', 'cluster', 'render', 'total')
+
+    def __init__(self) -> None:
+        self.started = time()
+        self._origin = monotonic()
+        # (источник, этап) -> [вызовов, секунд всего, самый долгий]
+        self.timings = {}
+        # источник -> байт в телах ответов, уже распакованных
+        self.bytes = {}
+        # источник -> [(секунд от начала прогона, длина очереди)]
+        self.queue = {}
+        # источник -> [потребителей, секунд занятости всех, секунд работы источника]
+        self.workers = {}
+
+    def forget(self, source: str) -> None:
+        """Сбрасывает метрики источника перед новым прогоном, для режима
+        наблюдения: в файлах остается последний прогон каждого источника"""
+        self.started = time()
+        self.timings = { key: value for key, value in self.timings.items() if key[0] != source }
+        for values in (self.bytes, self.queue, self.workers):
+            values.pop(source, None)
+
+    def add_time(self, source: str, stage: str, seconds: float) -> None:
+        calls, total, longest = self.timings.get((source, stage), (0, 0.0, 0.0))
+        self.timings[source, stage] = [calls + 1, total + seconds, max(longest, seconds)]
+
+    @contextmanager
+    def timer(self, source: str, stage: str) -> Iterator[None]:
+        """Замеряет время блока как один вызов этапа"""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(source, stage, perf_counter() - started)
+
+    def add_bytes(self, source: str, amount: int) -> None:
+        self.bytes[source] = self.bytes.get(source, 0) + amount
+
+    def sample_queue(self, source: str, depth: int) -> None:
+        self.queue.setdefault(source, []).append((round(monotonic() - self._origin, 3), depth))
+
+    def add_busy(self, source: str, seconds: float) -> None:
+        """Время, которое потребитель очереди был занят вакансией, а не ждал"""
+        self.workers.setdefault(source, [0, 0.0, 0.0])[1] += seconds
+
+    def set_workers(self, source: str, count: int, seconds: float) -> None:
+        """Сколько потребителей было у источника, и сколько он работал"""
+        workers = self.workers.setdefault(source, [0, 0.0, 0.0])
+        workers[0] += count
+        workers[2] = max(workers[2], seconds)
+
+    def utilisation(self, source: str) -> float | None:
+        """Доля времени, которую потребители источника были заняты"""
+        count, busy, seconds = self.workers.get(source, (0, 0.0, 0.0))
+        return busy / (count * seconds) if count and seconds else None
+
+    def snapshot(self) -> dict:
+        """Состояние для передачи из процесса источника в основной"""
+        return {'timings': self.timings, 'bytes': self.bytes, 'queue': self.queue, 'workers': self.workers}
+
+    def merge(self, snapshot: dict) -> None:
+        """Добавляет метрики другого процесса"""
+        for key, (calls, total, longest) in snapshot['timings'].items():
+            mine = self.timings.setdefault(key, [0, 0.0, 0.0])
+            self.timings[key] = [mine[0] + calls, mine[1] + total, max(mine[2], longest)]
+        for source, amount in snapshot['bytes'].items():
+            self.add_bytes(source, amount)
+        for source, samples in snapshot['queue'].items():
+            self.queue.setdefault(source, []).extend(samples)
+        for source, (count, busy, seconds) in snapshot['workers'].items():
+            self.add_busy(source, busy)
+            self.set_workers(source, count, seconds)
+
+    def sources(self) -> list[str]:
+        return sorted({ source for source, _ in self.timings } | set(self.bytes) | set(self.queue) | set(self.workers))
+
+    def rows(self) -> list[dict]:
+        """Сводка этапов для таблицы: строка на этап источника, в порядке
+        прохождения этапов, - так таблица узкая при любом их количестве"""
+        rows = []
+        for source in self.sources():
+            for stage in self.stages:
+                if (timing := self.timings.get((source, stage))) is None:
+                    continue
+                calls, total, longest = timing
+                rows.append({'источник': source, 'этап': stage, 'вызовов': calls, 'секунд': f'{total:.2f}', 'макс, с': f'{longest:.2f}'})
+        return rows
+
+    def source_rows(self) -> list[dict]:
+        """Сводка по источникам: очередь подробных данных, занятость её
+        потребителей и полученные килобайты"""
+        rows = []
+        for source in self.sources():
+            depths = [ depth for _, depth in self.queue.get(source, ()) ]
+            rows.append({
+                'источник': source,
+                'очередь ср/макс': f'{sum(depths) / len(depths):.1f}/{max(depths)}' if depths else '',
+                'загрузка': f'{utilisation:.0%}' if (utilisation := self.utilisation(source)) is not None else '',
+                'КБ': f'{self.bytes.get(source, 0) / 1024:.0f}'
+            })
+        return rows
+
+    def to_json(self, source: str | None = None) -> str:
+        """Прогон одной строкой json, чтобы дописывать прогоны в один файл.
+        Если передан source - только его метрики"""
+        def wanted(name: str) -> bool:
+            return source is None or name == source
+        return dumps({
+            'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'stages': [
+                {'source': name, 'stage': stage, 'calls': calls, 'seconds': round(total, 4), 'max': round(longest, 4)}
+                for (name, stage), (calls, total, longest) in sorted(self.timings.items()) if wanted(name)
+            ],
+            'bytes': { name: amount for name, amount in self.bytes.items() if wanted(name) },
+            'queue': { name: samples for name, samples in self.queue.items() if wanted(name) },
+            'utilisation': { name: self.utilisation(name) for name in self.workers if wanted(name) }
+        }, ensure_ascii=False)
+
+    def to_prometheus(self) -> str:
+        """Метрики в текстовом формате Prometheus, для textfile collector"""
+        def escape(value: str) -> str:
+            return value.replace('\\', '\\\\').replace('"', '\\"')
+        lines = []
+        def metric(name: str, help_text: str, values: list[tuple[dict, float]]) -> None:
+            lines.append(f'# HELP vw_{name} {help_text}')
+            lines.append(f'# TYPE vw_{name} gauge')
+            for labels, value in values:
+                label_text = ','.join(f'{key}="{escape(label)}"' for key, label in labels.items())
+                lines.append(f'vw_{name}{{{label_text}}} {value}')
+        timings = sorted(self.timings.items())
+        metric('stage_seconds', 'Time spent in a stage during the last run',
+               [ ({'source': source, 'stage': stage}, round(total, 6)) for (source, stage), (_, total, _) in timings ])
+        metric('stage_calls', 'Number of stage calls during the last run',
+               [ ({'source': source, 'stage': stage}, calls) for (source, stage), (calls, _, _) in timings ])
+        metric('stage_max_seconds', 'Longest single stage call during the last run',
+               [ ({'source': source, 'stage': stage}, round(longest, 6)) for (source, stage), (_, _, longest) in timings ])
+        metric('bytes', 'Response body bytes received during the last run',
+               [ ({'source': source}, amount) for source, amount in sorted(self.bytes.items()) ])
+        metric('queue_depth_max', 'Maximum detail queue depth during the last run',
+               [ ({'source': source}, max(depth for _, depth in samples)) for source, samples in sorted(self.queue.items()) if samples ])
+        metric('worker_utilisation', 'Share of time detail workers were busy during the last run',
+               [ ({'source': source}, round(utilisation, 4)) for source in sorted(self.workers)
+                 if (utilisation := self.utilisation(source)) is not None ])
+        lines.append('# HELP vw_last_run_timestamp_seconds Start time of the last run')
+        lines.append('# TYPE vw_last_run_timestamp_seconds gauge')
+        lines.append(f'vw_last_run_timestamp_seconds {self.started:.0f}')
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path: str, source: str | None = None) -> None:
+        """Дописывает прогон в файл json lines"""
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(self.to_json(source) + '\n')
+
+    def write_prometheus(self, path: str) -> None:
+        """Перезаписывает textfile. Через временный файл, чтобы коллектор
+        не прочитал его наполовину записанным"""
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+            file.write(self.to_prometheus())
+        replace(f'{path}.tmp', path)
+
+# метрики текущего процесса
+metrics = Metrics()
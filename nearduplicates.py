@@ -0,0 +1,97 @@
+from array import array
+from operator import eq
+from random import Random
+from re import compile
+from zlib import crc32
+
+# Поиск почти одинаковых текстов по MinHash. Текст разбивается на шинглы -
+# пары соседних слов, - и подпись хранит минимальные хэши шинглов. Доля
+# совпавших значений двух подписей оценивает сходство Жаккара их наборов
+# шинглов. Хэш-функция одна: её значения раскладываются по size корзинам,
+# и в каждой запоминается минимум (one permutation hashing), - это в size
+# раз дешевле, чем size отдельных хэш-функций, а точность почти та же.
+# Чтобы не сравнивать новую подпись со всеми, она режется на bands полос
+# по rows значений (LSH): тексты, похожие хотя бы на ~(1/bands)^(1/rows),
+# почти наверняка совпадут целиком хотя бы в одной полосе
+class MinHasher:
+    # простое число Мерсенна 2^61 - 1, по модулю которого считается хэш
+    prime = (1 << 61) - 1
+    # значения подписи хранятся 32-битными
+    max_hash = (1 << 32) - 1
+    words = compile(r'\w+')
+
+    def __init__(self, size: int = 64, bands: int = 16, shingle_size: int = 2, seed: int = 1) -> None:
+        if size % bands:
+            raise ValueError(f'Длина подписи {size} должна делиться на количество полос {bands}')
+        self.size = size
+        self.bands = bands
+        self.rows = size // bands
+        self.shingle_size = shingle_size
+        # коэффициенты хэш-функции вида (a * x + b) mod prime. Подписи хранятся
+        # в бд, поэтому они выводятся из seed и от запуска к запуску не меняются
+        generator = Random(seed)
+        self._a = generator.randrange(1, self.prime)
+        self._b = generator.randrange(0, self.prime)
+        # для каждой корзины - свой порядок, в котором смотрятся остальные,
+        # если она пуста (optimal densification)
+        self._probes = [ generator.sample(range(size), size) for _ in range(size) ]
+
+    def shingles(self, text: str) -> set[int]:
+        """Хэши шинглов текста. Регистр и знаки препинания не учитываются.
+        crc32, а не hash(), т.к. hash() строк меняется от запуска к запуску"""
+        words = self.words.findall(text.lower())
+        if len(words) < self.shingle_size:
+            return { crc32(' '.join(words).encode()) } if words else set()
+        # в описаниях много повторов, поэтому хэшируются только разные шинглы
+        shingles = set(map(' '.join, zip(*(words[start:] for start in range(self.shingle_size)))))
+        return { crc32(shingle.encode()) for shingle in shingles }
+
+    def signature(self, text: str) -> array:
+        """MinHash подпись текста. У пустого текста - из максимальных значений,
+        такие подписи ни с чем не считаются похожими"""
+        shingles = self.shingles(text)
+        if not shingles:
+            return array('I', [self.max_hash] * self.size)
+        a, b, prime, size, max_hash = self._a, self._b, self.prime, self.size, self.max_hash
+        empty = max_hash + 1
+        bins = [empty] * size
+        for value in [ (a * shingle + b) % prime for shingle in shingles ]:
+            value, position = divmod(value, size)
+            value &= max_hash
+            if value < bins[position]:
+                bins[position] = value
+        # у коротких текстов часть корзин пуста, каждая берет значение первой
+        # непустой в своем порядке _probes. Порядок у всех текстов общий, так
+        # что оценка сходства остается такой же точной, как у size хэш-функций
+        if empty in bins:
+            source = bins[:]
+            for position, probes in enumerate(self._probes):
+                if source[position] == empty:
+                    for probe in probes:
+                        if source[probe] != empty:
+                            bins[position] = source[probe]
+                            break
+        return array('I', bins)
+
+    def band_keys(self, signature: array) -> list[tuple[int, int]]:
+        """Ключи полос подписи: номер полосы и хэш её значений"""
+        return [ (band, crc32(signature[band * self.rows : (band + 1) * self.rows].tobytes()))
+                 for band in range(self.bands) ]
+
+    @staticmethod
+    def similarity(first: array, second: array) -> float:
+        """Оценка сходства Жаккара по двум подписям"""
+        return sum(map(eq, first, second)) / len(first)
+
+    def is_empty(self, signature: array) -> bool:
+        return signature[0] == self.max_hash and min(signature) == self.max_hash
+
+    @staticmethod
+    def dump(signature: array) -> bytes:
+        return signature.tobytes()
+
+    @staticmethod
+    def load(data: bytes) -> array:
+        signature = array('I')
+        signature.frombytes(data)
+        return signature
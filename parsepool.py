@@ -0,0 +1,93 @@
+import asyncio
+from multiprocessing import get_context
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from os import cpu_count
+from time import perf_counter
+from typing import Callable, TypeVar
+
+T = TypeVar('T')
+
+def _timed(function: Callable[..., T], *args) -> tuple[T, float]:
+    """Выполняет разбор и замеряет его время уже там, где он выполнялся"""
+    started = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - started
+
+# Разбор страниц вне цикла событий. Пока страница разбирается прямо в цикле,
+# стоят все остальные запросы, а большое описание с hh разбирается десятки
+# миллисекунд. kind выбирает, где разбирать:
+#   inline  - в самом цикле, как раньше
+#   thread  - в пуле потоков. lxml отпускает GIL, пока строит дерево, так что
+#             и на одном ядре цикл не ждет разбор целиком
+#   process - в пуле процессов по числу ядер, разбор идет параллельно с сетью
+#             по-настоящему. Функция и аргументы передаются в процесс, а
+#             результат - обратно, поэтому отдавать лучше поля, а не дерево.
+#             Процессы запускаются через forkserver, а не fork из процесса,
+#             где уже крутятся цикл событий и потоки. Настройки разбора им
+#             передает initializer. Сообщения лога и статистика из процессов
+#             пула не доходят
+# Пул сам считает, сколько задач ждут разбора, и сколько они ждали
+class ParsePool:
+    kinds = ('inline', 'thread', 'process')
+
+    def __init__(
+            self,
+            kind: str = 'thread',
+            workers: int | None = None,
+            initializer: Callable | None = None,
+            initargs: tuple = ()
+            ) -> None:
+        if kind not in self.kinds:
+            raise ValueError(f'Неизвестный способ разбора {kind}, доступны {", ".join(self.kinds)}')
+        self.kind = kind
+        self.workers = workers or cpu_count() or 1
+        self._executor = None
+        self._initializer = initializer
+        self._initargs = initargs
+        # статистика для лога: задач, ждут сейчас и больше всего разом,
+        # секунд ожидания в очереди пула и самого разбора
+        self.tasks = 0
+        self.pending = 0
+        self.max_pending = 0
+        self.waited = 0.0
+        self.parsed = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=get_context('forkserver'),
+                    initializer=self._initializer, initargs=self._initargs
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='parse')
+        return self._executor
+
+    async def run(self, function: Callable[..., T], *args) -> tuple[T, float, float]:
+        """Выполняет function(*args) в пуле. Отдает результат, сколько секунд
+        задача ждала в очереди пула и сколько длился сам разбор"""
+        self.tasks += 1
+        if self.kind == 'inline':
+            result, parsed = _timed(function, *args)
+            self.parsed += parsed
+            return result, 0.0, parsed
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        started = perf_counter()
+        try:
+            result, parsed = await asyncio.get_running_loop().run_in_executor(self._get_executor(), _timed, function, *args)
+        finally:
+            self.pending -= 1
+        waited = max(perf_counter() - started - parsed, 0.0)
+        self.waited += waited
+        self.parsed += parsed
+        return result, waited, parsed
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __repr__(self) -> str:
+        return (f'ParsePool(kind={self.kind}, workers={self.workers}, tasks={self.tasks}, '
+                f'max_pending={self.max_pending}, waited={self.waited:.2f}s, parsed={self.parsed:.2f}s)')
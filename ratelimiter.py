@@ -0,0 +1,99 @@
+import asyncio
+from time import monotonic
+
+# Ограничитель запросов к одному хосту. Средняя частота задается token bucket,
+# а количество одновременных запросов подстраивается по AIMD: растет понемногу,
+# пока хост отвечает быстро и без ошибок, и делится пополам при 429/5xx,
+# ошибке соединения или резком росте задержки
+class HostLimiter:
+    # во сколько раз задержка ответа должна превысить обычную для хоста,
+    # чтобы считать это признаком перегрузки
+    latency_factor = 2.0
+    # вес нового замера в скользящем среднем задержки
+    latency_weight = 0.1
+
+    def __init__(
+            self,
+            rate: float,
+            burst: int = 1,
+            min_concurrency: int = 1,
+            max_concurrency: int = 5
+            ) -> None:
+        # запросов в секунду и сколько их можно сделать разом после простоя
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._refilled = monotonic()
+        # пределы, в которых гуляет количество одновременных запросов.
+        # Начинаем с нижнего и разгоняемся, если хост не против
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(min_concurrency)
+        self.in_flight = 0
+        # обычная задержка ответа хоста, скользящее среднее по удачным ответам
+        self.latency = None
+        # сколько раз пришлось сбрасывать скорость, для лога
+        self.backoffs = 0
+        self._condition = asyncio.Condition()
+        self._bucket_lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        """Добавляет в ведро токены, накопившиеся с прошлого раза"""
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    async def acquire(self) -> None:
+        """Ждет, пока освободится место среди одновременных запросов,
+        и появится токен в ведре"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.concurrency))
+            self.in_flight += 1
+        # токены выдаются строго по очереди, иначе ждущие разом уйдут в минус.
+        # Если запрос отменили, пока он ждал токен, место надо вернуть
+        try:
+            async with self._bucket_lock:
+                self._refill()
+                if self.tokens < 1:
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+                    self._refill()
+                self.tokens -= 1
+        except asyncio.CancelledError:
+            await self.discard()
+            raise
+
+    async def release(self, status: int | None, latency: float) -> None:
+        """Освобождает место и подстраивает количество одновременных запросов
+        по результату. status None - запрос не удался вовсе"""
+        overloaded = (
+            status is None
+            or status == 429
+            or status >= 500
+            or (self.latency is not None and latency > self.latency * self.latency_factor)
+        )
+        if overloaded:
+            # мультипликативное снижение, заодно опустошаем ведро,
+            # чтобы следующий запрос ушел не сразу
+            self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+            self.tokens = 0
+            self.backoffs += 1
+        else:
+            # аддитивный рост: примерно +1 за каждые concurrency удачных ответов
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self.latency = latency if self.latency is None else (
+                self.latency * (1 - self.latency_weight) + latency * self.latency_weight
+            )
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    async def discard(self) -> None:
+        """Освобождает место запроса, отмененного до ответа. Об ответе хоста
+        он ничего не говорит, так что скорость не меняется"""
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def __repr__(self) -> str:
+        return (f'HostLimiter(rate={self.rate}, concurrency={self.concurrency:.1f}/{self.max_concurrency}, '
+                f'backoffs={self.backoffs})')
@@ -0,0 +1,169 @@
+import asyncio
+from collections import deque
+from random import uniform
+from statistics import quantiles
+from time import monotonic
+from typing import Awaitable, Callable, TypeVar
+import aiohttp
+from ratelimiter import HostLimiter
+
+T = TypeVar('T')
+
+# Повторы неудачных запросов одного источника. Пауза перед повтором растет
+# экспоненциально и берется случайной от нуля до потолка (full jitter), чтобы
+# запросы, упавшие разом, не повторялись тоже разом. Бюджет ограничивает долю
+# повторов от всех запросов источника: если хост лежит, повторы его не
+# добьют, а источник не будет ждать впустую. По желанию медленный запрос
+# дублируется (hedging): если ответа нет дольше p95 обычной задержки,
+# уходит второй такой же, и берется тот ответ, что придет первым. Только
+# для запросов, помеченных как допускающие дубль
+class Retrier:
+    # статусы, при которых запрос имеет смысл повторить. None - запрос
+    # не удался вовсе: ошибка соединения или таймаут
+    retry_statuses = frozenset((None, 429, 500, 502, 503, 504))
+    # по скольким последним удачным запросам считать p95, и сколько
+    # их нужно хотя бы, чтобы оценке можно было верить
+    latency_window = 200
+    min_latency_samples = 20
+
+    def __init__(
+            self,
+            attempts: int = 3,
+            base_delay: float = 0.5,
+            max_delay: float = 8.0,
+            budget_ratio: float = 0.2,
+            min_budget: int = 5,
+            hedge: bool = False
+            ) -> None:
+        # всего попыток на запрос, включая первую
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # повторов и дублей можно не больше budget_ratio от всех запросов,
+        # плюс min_budget, чтобы первые же ошибки было чем повторить
+        self.budget_ratio = budget_ratio
+        self.min_budget = min_budget
+        self.hedge = hedge
+        self._latencies = deque(maxlen=self.latency_window)
+        # статистика для лога
+        self.requests = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.exhausted = 0
+
+    def delay(self, attempt: int) -> float:
+        """Пауза перед повтором номер attempt, начиная с нуля"""
+        return uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _spend_budget(self) -> bool:
+        """Забирает из бюджета один повтор или дубль, если он еще есть"""
+        if self.retries + self.hedges < self.min_budget + self.requests * self.budget_ratio:
+            return True
+        self.exhausted += 1
+        return False
+
+    def hedge_delay(self) -> float | None:
+        """Через сколько секунд без ответа дублировать запрос. None - не
+        дублировать: выключено, или удачных запросов для оценки еще мало"""
+        if not self.hedge or len(self._latencies) < self.min_latency_samples:
+            return None
+        return quantiles(self._latencies, n=20)[-1]
+
+    async def _attempt(
+            self,
+            request: Callable[[], Awaitable[tuple[int | None, T]]],
+            limiter: HostLimiter | None,
+            started: asyncio.Event
+            ) -> tuple[int | None, T]:
+        """Одна попытка: ждет очереди у ограничителя, отмечает started и
+        выполняет запрос. Задержка удачных пополняет статистику, а ограничителю
+        сообщается результат - кроме отмененных дублей, они не его забота"""
+        if limiter is not None:
+            await limiter.acquire()
+        started.set()
+        status, begun = None, monotonic()
+        try:
+            status, result = await request()
+        except asyncio.CancelledError:
+            if limiter is not None:
+                await limiter.discard()
+            raise
+        except BaseException:
+            if limiter is not None:
+                await limiter.release(None, monotonic() - begun)
+            raise
+        latency = monotonic() - begun
+        if limiter is not None:
+            await limiter.release(status, latency)
+        if status not in self.retry_statuses:
+            self._latencies.append(latency)
+        return status, result
+
+    async def _hedged(self, request: Callable[[], Awaitable[tuple[int | None, T]]], limiter: HostLimiter | None) -> tuple[int | None, T]:
+        """Попытка, которая дублируется, если ответа нет дольше p95. Отсчет
+        идет с момента, когда запрос пропустил ограничитель. Побеждает
+        первый удачный ответ, другой запрос отменяется"""
+        started = asyncio.Event()
+        first = asyncio.create_task(self._attempt(request, limiter, started))
+        pending = {first}
+        try:
+            if (delay := self.hedge_delay()) is None:
+                return await first
+            waiter = asyncio.create_task(started.wait())
+            await asyncio.wait((first, waiter), return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            done, _ = await asyncio.wait((first,), timeout=delay)
+            if done or not self._spend_budget():
+                return await first
+            self.hedges += 1
+            second = asyncio.create_task(self._attempt(request, limiter, asyncio.Event()))
+            pending.add(second)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result()[0] not in self.retry_statuses:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                # обе попытки неудачны - отдаем результат или ошибку последней
+                if not pending:
+                    return task.result()
+        finally:
+            # и проигравший дубль, и всё, если отменили саму попытку
+            pending = [ task for task in pending if not task.done() ]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def call(
+            self,
+            request: Callable[[], Awaitable[tuple[int | None, T]]],
+            limiter: HostLimiter | None = None,
+            hedge: bool = False
+            ) -> tuple[int | None, T]:
+        """Выполняет request - корутину, которая делает запрос и отдает статус
+        код и результат, - повторяя при ошибках соединения, таймаутах и
+        статусах из retry_statuses, пока есть попытки и бюджет. Если передан
+        limiter, каждая попытка проходит через него. hedge - запрос можно
+        дублировать, если дублирование включено. Отдает последний результат,
+        или пробрасывает последнюю ошибку"""
+        self.requests += 1
+        for number in range(self.attempts):
+            try:
+                if hedge and self.hedge:
+                    status, result = await self._hedged(request, limiter)
+                else:
+                    status, result = await self._attempt(request, limiter, asyncio.Event())
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if number == self.attempts - 1 or not self._spend_budget():
+                    raise
+            else:
+                if status not in self.retry_statuses or number == self.attempts - 1 or not self._spend_budget():
+                    return status, result
+            self.retries += 1
+            await asyncio.sleep(self.delay(number))
+
+    def __repr__(self) -> str:
+        return (f'Retrier(requests={self.requests}, retries={self.retries}, hedges={self.hedges}, '
+                f'hedge_wins={self.hedge_wins}, exhausted={self.exhausted})')
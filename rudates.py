@@ -0,0 +1,103 @@
+from datetime import date, timedelta
+from functools import lru_cache
+from re import compile, IGNORECASE
+
+# Разбор дат с сайтов-источников. Почти все даты приходят в нескольких
+# известных видах: "12 октября", "12 октября 2023", "01.02.2024", "Сегодня",
+# "Вчера", - их разбирают заранее скомпилированные регулярные выражения.
+# dateutil с fuzzy=True понимает что угодно, но в сотни раз медленнее, поэтому
+# он нужен только для строк незнакомого вида. Строки на странице повторяются
+# (у всех вакансий списка одна-две даты), так что результаты еще и кэшируются
+class DateParser:
+    # первые буквы месяцев, по ним узнается и "окт", и "октября"
+    months = {
+        'янв': 1, 'фев': 2, 'мар': 3, 'апр': 4, 'май': 5, 'мая': 5, 'июн': 6,
+        'июл': 7, 'авг': 8, 'сен': 9, 'окт': 10, 'ноя': 11, 'дек': 12
+    }
+    # сколько дней назад - для слов вместо даты
+    relative = {'сегодня': 0, 'вчера': 1, 'позавчера': 2}
+    numeric = compile(r'\b(\d{1,2})\.(\d{1,2})\.(\d{4}|\d{2})\b')
+    iso = compile(r'\b(\d{4})-(\d{2})-(\d{2})')
+    verbal = compile(r'\b(\d{1,2})\s+(янв|фев|мар|апр|ма[йя]|июн|июл|авг|сен|окт|ноя|дек)[а-я]*\.?(?:\s+(\d{4}))?', IGNORECASE)
+    words = compile(r'\b(позавчера|вчера|сегодня)\b', IGNORECASE)
+
+    def __init__(self, cache_size: int = 1024) -> None:
+        # ключ кэша - строка и сегодняшняя дата, т.к. "Вчера" завтра будет другим днем
+        self._cached = lru_cache(maxsize=cache_size)(self._parse)
+        self._parserinfo = None
+        # статистика для лога
+        self.calls = 0
+        self.fast = 0
+        self.fallbacks = 0
+        self.failures = 0
+
+    def _fast(self, text: str, today: date) -> date | None:
+        """Разбор известных видов даты, None - вид незнакомый. Дата без года -
+        ближайшая прошедшая: "25 декабря" в январе - это прошлый год"""
+        if match := self.numeric.search(text):
+            day, month, year = map(int, match.groups())
+            return date(year + 2000 if year < 100 else year, month, day)
+        if match := self.verbal.search(text):
+            day, month, year = match.groups()
+            month = self.months[month[:3].lower()]
+            if year:
+                return date(int(year), month, int(day))
+            result = date(today.year, month, int(day))
+            return result if result <= today else date(today.year - 1, month, int(day))
+        if match := self.iso.search(text):
+            return date(*map(int, match.groups()))
+        if match := self.words.search(text):
+            return today - timedelta(days=self.relative[match.group(1).lower()])
+        return None
+
+    def _fallback(self, text: str) -> date | None:
+        """Разбор dateutil для незнакомых строк. Он и его русские названия
+        месяцев загружаются при первой такой строке"""
+        from dateutil.parser import parse, parserinfo
+        if self._parserinfo is None:
+            # локализуем парсер
+            class RussianParserInfo(parserinfo):
+                MONTHS = [
+                    ('янв', 'января'),
+                    ('фев', 'февраля'),
+                    ('мар', 'марта'),
+                    ('апр', 'апреля'),
+                    ('май', 'мая'),
+                    ('июн', 'июня'),
+                    ('июл', 'июля'),
+                    ('авг', 'августа'),
+                    ('сен', 'сент', 'сентября'),
+                    ('окт', 'октября'),
+                    ('ноя', 'ноября'),
+                    ('дек', 'декабря')
+                ]
+            self._parserinfo = RussianParserInfo(dayfirst=True)
+        try:
+            return parse(text, parserinfo=self._parserinfo, fuzzy=True).date()
+        except (ValueError, OverflowError):
+            return None
+
+    def _parse(self, text: str, today: date) -> date | None:
+        try:
+            result = self._fast(text, today)
+        except ValueError:
+            # вид знакомый, но даты такой нет, вроде 31.02
+            result = None
+        else:
+            if result is not None:
+                self.fast += 1
+                return result
+        self.fallbacks += 1
+        if (result := self._fallback(text)) is None:
+            self.failures += 1
+        return result
+
+    def parse(self, text: str, today: date) -> date | None:
+        """Дата из строки, или None, если её не удалось найти. today - от
+        какого дня считать "Сегодня" и "Вчера" и подставлять год"""
+        self.calls += 1
+        return self._cached(text.strip(), today)
+
+    def __repr__(self) -> str:
+        return (f'DateParser(calls={self.calls}, cached={self._cached.cache_info().hits}, fast={self.fast}, '
+                f'fallbacks={self.fallbacks}, failures={self.failures})')
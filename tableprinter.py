@@ -1,38 +1,194 @@
-from os import get_terminal_size
+import sys
+from shutil import get_terminal_size
 from math import ceil, floor
+from itertools import chain, islice
+from collections import Counter
+from functools import lru_cache
+from re import compile
+from unicodedata import east_asian_width, combining, category
+from typing import Iterable, Iterator, TextIO
+
+@lru_cache(maxsize=None)
+def _char_width(char: str) -> int:
+    """Сколько знакомест занимает символ в терминале"""
+    # комбинируемые знаки (ударения и т.п.) и невидимые форматирующие
+    # символы ложатся на предыдущий символ
+    if combining(char) or category(char) in ('Mn', 'Me', 'Cf'):
+        return 0
+    return 2 if east_asian_width(char) in ('W', 'F') else 1
+
+# Блоки юникода, где встречаются символы шириной не в одно знакоместо:
+# комбинируемые знаки, невидимые символы, восточноазиатские и эмодзи.
+# Ширина символов из них берется из unicodedata, остальные считаются
+# за одно знакоместо без проверки - так почти любой текст вакансий
+# измеряется просто длиной строки
+_special_chars = compile(
+    '[\u00ad\u0300-\u036f\u0483-\u0489\u0591-\u05c7\u0610-\u061a\u064b-\u065f'
+    '\u0900-\u0903\u093a-\u094f\u0951-\u0957\u0962\u0963\u1100-\u115f'
+    '\u1ab0-\u1aff\u1dc0-\u1dff\u200b-\u200f\u202a-\u202e\u2060-\u2064\u20d0-\u20ff'
+    '\u2e80-\u303e\u3041-\u33ff\u3400-\u4dbf\u4e00-\u9fff\ua000-\ua4cf\ua960-\ua97f'
+    '\uac00-\ud7a3\uf900-\ufaff\ufe00-\ufe0f\ufe10-\ufe19\ufe20-\ufe2f\ufe30-\ufe6f'
+    '\ufeff\uff00-\uff60\uffe0-\uffe6\U0001f300-\U0001f64f\U0001f900-\U0001f9ff'
+    '\U00020000-\U0003fffd]'
+)
+
+def _is_narrow(text: str) -> bool:
+    """Все ли символы текста занимают ровно одно знакоместо. Для латиницы
+    и кириллицы проверяется кодированием в cp1251 - в ней нет ни широких,
+    ни комбинируемых символов, а кодек работает куда быстрее регулярки"""
+    if text.isascii():
+        return True
+    try:
+        text.encode('cp1251')
+    except UnicodeEncodeError:
+        return not _special_chars.search(text)
+    # мягкий перенос в cp1251 есть, но на экране он не виден
+    return '\xad' not in text
+
+def display_width(text: str) -> int:
+    """Ширина строки в знакоместах терминала, а не в символах: широкие
+    восточноазиатские символы занимают два, комбинируемые знаки - ни одного"""
+    if _is_narrow(text):
+        return len(text)
+    return len(text) + sum(_char_width(char) - 1 for char in _special_chars.findall(text))
+
+# слова и промежутки между ними
+_tokens = compile(r'[^ ]+| +')
+
+def _split_word(word: str, width: int) -> list[str]:
+    """Режет слово, не влезающее в линию, на куски не шире width.
+    Комбинируемый знак остается при своем символе, а широкий символ
+    в колонке уже него все равно выводится целиком"""
+    chunks, chunk, chunk_width = [], '', 0
+    for char in word:
+        char_width = _char_width(char)
+        if chunk and chunk_width + char_width > width:
+            chunks.append(chunk)
+            chunk, chunk_width = '', 0
+        chunk += char
+        chunk_width += char_width
+    chunks.append(chunk)
+    return chunks
+
+def _wrap_narrow(text: str, width: int) -> list[str]:
+    """Перенос по словам текста, где каждый символ занимает одно знакоместо.
+    Ширина тут - длина строки, так что линии отрезаются срезами, а место
+    переноса ищется поиском пробела в пределах линии"""
+    lines = []
+    text = text.strip(' ')
+    position, end = 0, len(text)
+    while end - position > width:
+        # последний пробел, до которого текст влезает в линию
+        cut = text.rfind(' ', position, position + width + 1)
+        if cut > position:
+            lines.append(text[position : cut].rstrip(' '))
+            position = cut + 1
+        else:
+            # слово длиннее линии - режем
+            lines.append(text[position : position + width])
+            position += width
+        # пробелы в начале линии не нужны
+        while position < end and text[position] == ' ':
+            position += 1
+    lines.append(text[position :])
+    return lines
+
+def _wrap_tokens(text: str, width: int) -> list[str]:
+    """Перенос по словам текста с широкими и комбинируемыми символами,
+    где ширину приходится считать по словам"""
+    lines, line, line_width = [], '', 0
+    for token in _tokens.findall(text):
+        token_width = display_width(token)
+        if line_width + token_width <= width:
+            # пробелы в начале линии не нужны
+            if line or token[0] != ' ':
+                line += token
+                line_width += token_width
+            continue
+        # не влезло - пробелы на переносе пропадают, слово уходит на новую линию
+        if line:
+            lines.append(line.rstrip(' '))
+            line, line_width = '', 0
+        if token[0] == ' ':
+            continue
+        *full_chunks, line = _split_word(token, width) if token_width > width else [token]
+        lines.extend(full_chunks)
+        line_width = display_width(line)
+    # пустая последняя линия нужна, только если пуст весь текст
+    if line or not lines:
+        lines.append(line.rstrip(' '))
+    return lines
+
+def _wrap(text: str, width: int) -> tuple[str, ...]:
+    """Разбивает текст на линии не шире width знакомест, перенося по словам.
+    Слово длиннее линии режется. Линии уже дополнены пробелами до width"""
+    if _is_narrow(text):
+        return tuple(line + ' ' * (width - len(line)) for line in _wrap_narrow(text, width))
+    return tuple(line + ' ' * (width - display_width(line)) for line in _wrap_tokens(text, width))
+
+# короткие ячейки (компании, даты, зарплаты) повторяются, их перенос запоминается
+_wrap_cached = lru_cache(maxsize=4096)(_wrap)
+
+def wrap(text: str, width: int) -> tuple[str, ...]:
+    """Перенос текста ячейки по словам, короткие ячейки - из кэша"""
+    return _wrap_cached(text, width) if len(text) <= 256 else _wrap(text, width)
+
+_display_width_cached = lru_cache(maxsize=4096)(display_width)
+
+def cell_width(text: str) -> int:
+    """Ширина ячейки в знакоместах, короткие ячейки - из кэша"""
+    return _display_width_cached(text) if len(text) <= 256 else display_width(text)
+
+class _TerminalWidth:
+    """Ширина терминала для TablePrinter.terminal_size. Запрашивается при
+    первом обращении, а не при импорте, и запоминается в классе. Если вывод
+    не в терминал, берется COLUMNS из окружения, либо 80"""
+
+    def __get__(self, instance: object, owner: type) -> int:
+        owner.terminal_size = get_terminal_size().columns - 1
+        return owner.terminal_size
 
 # Класс для представления таблицы из бд в виде таблицы из псевдографики
 # Стандартные средства не умеют объединять ячейки
 class TablePrinter:
     # К столбцам будем относить пробелы вокруг текста и черту справа от текста
     # Один же символ резервируем под самую левую черту
-    terminal_size = get_terminal_size().columns - 1
+    terminal_size = _TerminalWidth()
     # количество добавочных к каждой колонке символов, чтобы нарисовать таблицу
     # пробел перед контентом, пробел после контента и |
     column_frame = 3
+    # сколько первых строк брать для расчета ширины колонок, если тело
+    # таблицы - не список, а итератор, который не прочесть дважды
+    sample_size = 1000
+    # сколько линий копить перед записью в файл
+    buffer_lines = 256
 
     # В headers предполагается массив ключей типа ['aaa', 'bbb', ('ccc', 5), ('ddd', 100)],
     # где кортежы пределяют ширину ячейки в процентах от терминала. 100% ячейка будет
-    # вынесена под более мелкие ячейки и займер всю ширину
+    # вынесена под более мелкие ячейки и займер всю ширину.
+    # body - строки таблицы, словари. Если это список, то ширины колонок считаются
+    # по всем строкам, если любой другой итератор - по первым sample_size строкам,
+    # а остальные строки выводятся по мере чтения, не накапливаясь в памяти
     def __init__(
             self, headers: list,
-            body: list,
+            body: Iterable[dict],
             header_rename: dict = {},
             header_size_matters: bool = False,
-            shrink_cols_to_content: bool = True
+            shrink_cols_to_content: bool = True,
+            sample_size: int | None = None,
+            width_percentile: float | None = None
             ) -> None:
         # Наименования всех колонок
         self._headers = headers
-        # Массив словарей - строк таблицы
-        self.body = []
-        # Приведем все к строкам, дабы можно было работать и длинами строк, а также
-        # уберем случайные переходы на новую строку. Изменим еще названия колонок,
-        # если таковые заданы
-        for row in body:
-            stringified_dict = {}
-            for k, v in row.items():
-                stringified_dict[k] = str(v).replace('\n', '')
-            self.body.append(stringified_dict)
+        if isinstance(body, list):
+            # строки, по которым считаются ширины, и строки на вывод - одно и то же
+            self._sample = body
+            self.body = body
+        else:
+            # первые строки читаются заранее, остальные пойдут следом за ними
+            body = iter(body)
+            self._sample = list(islice(body, sample_size or self.sample_size))
+            self.body = chain(self._sample, body)
         # если понадобится переназвать заголовки
         self.header_rename = header_rename
         # при расчете ширины колонки, будет браться в расчет как ширина
@@ -41,6 +197,10 @@ class TablePrinter:
         # при расчете ширины колонки, она будет сужаться, если
         # контент занимает меньше, чем задано
         self.shrink_cols = shrink_cols_to_content
+        # ширина контента колонки - не самая длинная ячейка, а этот процентиль
+        # длин ячеек. Тогда одна огромная ячейка не раздувает всю колонку,
+        # а просто выводится в несколько линий
+        self.width_percentile = width_percentile
 
     @classmethod
     def _percent_to_value(cls, value: int) -> int:
@@ -56,68 +216,58 @@ class TablePrinter:
         Функция корректирует ширину заданную в символах в реально необходимую
         predefined - то, что было задано в процентах изначально"""
 
-        # если учитывается длина контента заголовка
-        if self.header_size_matters:
-            # то вычисляем длину данного заголовка в символах с учетом переименования
-            # если оно есть
-            if (renamed_header := self.header_rename.get(name)) is not None:
-                header = [len(renamed_header)]
+        return min(self._content_widths[name], predefined_width)
+
+    def _collect_stats(self) -> None:
+        """Считает для каждой колонки, сколько в ней
+        ячеек какой длины, и по этому - ширину, нужную её контенту"""
+
+        length_counts = {
+            name: Counter([ cell_width(self._cell(row[name])) for row in self._sample ])
+            for name in self.sequence
+        }
+        self._content_widths = {}
+        for name, counts in length_counts.items():
+            if self.width_percentile is None:
+                content_width = max(counts)
             else:
-                header = [len(name)]
-        else:
-            header = []
-        content_width = max([ len(k[name]) for k in self.body ] + header)
-        # может получиться, что колонка пуста, а запись всего одна. Дабы сохранить структуру
-        # таблицы, даже пустая строка должна присутствовать. Поэтому дадим ей один символ
-        if content_width == 0:
-            content_width = 1
-        if content_width < predefined_width:
-            self._row_shrunk = True
-            return content_width
-        return predefined_width
-
-    def _get_content_max_lines(self, row: dict) -> dict:
-        """Считает, сколько строк понадобится, чтобы вывести весь контент
-        заданной строки при вычисленных длинах её колонок."""
-
-        # all - количество колонок обычных строк, не полноширинных
-        rows_length = {'all': 0}
-        # отвильтруем лишние данные
-        filtered_row = [ (k, v) for k, v in row.items() if k in list(self.headers.keys()) + self.full_size_rows ]
-        for k, v in filtered_row:
-            # если колонка - полноширинная
-            if k in self.full_size_rows:
-                # считаем её по отношению к ширине всего терминала
-                rows_length[k] = ceil(len(v) / (self.terminal_size ))
-            # если обычная, то делим длину контента на отведенную длину, из которой 3 символа зарезервированы
-            elif (item_len := ceil(len(v) / self.headers[k])) > rows_length['all']:
-                # возвращаем максимальное значение строк, получившееся в какой либо из колонок
-                rows_length['all'] = item_len
-        return rows_length
-
-    def _share_reminder(self, reminder: int, cols: list) -> int | None:
+                # идем по длинам от коротких, пока не наберется нужная доля ячеек
+                threshold = ceil(self.width_percentile / 100 * len(self._sample))
+                seen = 0
+                for content_width in sorted(counts):
+                    seen += counts[content_width]
+                    if seen >= threshold:
+                        break
+            # если учитывается длина контента заголовка, то берем в расчет длину
+            # данного заголовка в символах с учетом переименования, если оно есть
+            if self.header_size_matters:
+                content_width = max(content_width, display_width(self.header_rename.get(name, name)))
+            # может получиться, что колонка пуста, а запись всего одна. Дабы сохранить структуру
+            # таблицы, даже пустая строка должна присутствовать. Поэтому дадим ей один символ
+            self._content_widths[name] = content_width or 1
+
+    def _share_reminder(self, reminder: int, cols: list) -> None:
         """Делит остаток строки поровну между колонками без заранее заданной
-        ширины. Если какая то строка при этом окажется меньше, то выкидывает
-        её и делит заново"""
+        ширины. Колонки, которым хватает меньшего, получают по контенту,
+        а освободившееся место снова делится между остальными - пока
+        делить больше нечего"""
 
-        # так как функция рекурсивная, то сначала нужно проверить, есть ли еще элементы на входе
-        if not cols:
-            return
-        # сбросим флаг
-        self._row_shrunk = False
-        # ширина колонок
-        width = floor(reminder/len(cols))
-        for item in cols:
-            # проверяем соответствие заявленных ширин требуемым
-            self.headers[item] = self._get_content_max_width(item, width)
-            # если колонка изменила размер - убираем её и считаем заново для тех что остались
-            if self._row_shrunk:
-                cols.remove(item)
-                self._share_reminder(reminder - self.headers[item], cols)
+        cols = list(cols)
+        while cols:
+            # ширина колонок
+            width = floor(reminder / len(cols))
+            # колонки, контент которых уже. От сужения одних колонок остальным
+            # места только прибавляется, так что узкие остаются узкими
+            narrow = [ name for name in cols if self._content_widths[name] < width ]
+            for name in narrow:
+                self.headers[name] = self._content_widths[name]
+                reminder -= self.headers[name]
+            cols = [ name for name in cols if name not in narrow ]
+            if not narrow:
+                for name in cols:
+                    self.headers[name] = width
                 return
 
-
-
     def _get_lengths(self) -> None:
         """Вычисляет реальные длины колонок в символах,
         расфасовывает по категориям"""
@@ -172,6 +322,8 @@ class TablePrinter:
                         )
                     cols_with_width.append(item)
                     self.sequence.append(name)
+        # длины контента всех колонок, за один проход по строкам
+        self._collect_stats()
         # вычислим необходимое количество служебных символов, и зарезервируем их
         reminder -= self.column_frame * (len(cols_with_width) + len(cols_without_width))
         # вычисляем ширины колонок с заданными ширинами
@@ -189,7 +341,7 @@ class TablePrinter:
             if width_of_cols_without_width < 1:
                 raise ValueError('Для колонок, с неуказанной шириной, осталось места менее 1 символа на каждую. Этого мало')
         # вычислим ширины всех оставшихся строк
-        # если учитываем ширину контента, то вычисляем рекурсивнно
+        # если учитываем ширину контента, то делим остаток с учетом контента
         if self.shrink_cols:
             self._share_reminder(reminder, cols_without_width)
         else:
@@ -201,54 +353,76 @@ class TablePrinter:
         # ужаться, в соответствии с данными
         self.terminal_size = sum(self.headers.values()) + self.column_frame * (len(self.headers) - len(self.full_size_rows))
     
-    def _assemble_str_line(self, name: str, content: str) -> str:
-        """Прибавляет к строке content очередную ячейку, огороженную табличным оформлением"""
-
-        return f' {content}{" " * (self.headers[name] - len(content))} |'
-
-    def printer(self) -> None:
-        """Основная функция. Делает красиво"""
-
-        if self.body:
-            # Посчитаем параметры будущей таблицы
-            self._get_lengths()
-            # горизонтальная черта
-            row_splitter = '-' * (sum(self.headers.values()) + 1 + self.column_frame * len(self.headers))
-            print(row_splitter)
-            # заголовки - такая же строка для вывода. Нужно их присоединить в нчала общего массива с данными
-            header_dict = { k: self.header_rename.get(k, k) for k in self.headers.keys() }
-            # перебираем массив данных
-            for item in [header_dict] + self.body:
-                # количество линий для данной строки бд
-                item_lines = self._get_content_max_lines(item)
-                for line in range(item_lines['all']):
-                    # левая сторона таблицы
-                    assembly_line = '|'
-                    # контент во всех колонках, кроме полноширинных, бьем на куски, чтобы влезли в линию, и собираем линию
-                    # необходимо также сохранить первоначальную последовательность колонок,
-                    # поэтому будем идти по self._headers исключая полноширинные, но брать значения из headers
-                    for name in self.sequence:
-                        # смещение в строке для каждой новой линии
-                        line_shift = line * self.headers[name]
-                        assembly_line += self._assemble_str_line(
-                            name, item[name][line_shift : line_shift + self.headers[name]] if line != item_lines['all'] - 1 else item[name][line_shift :]
-                        )
-                    print(assembly_line)
-                print(row_splitter)
-                # для полноширинных все то же самое, только без функции сборки линии
-                for full_row in self.full_size_rows:
-                    # пропуск заголовка, такие колонки его не имеют
-                    if item.get(full_row, None) is not None:
-                        for line in range(item_lines[full_row]):
-                            line_shift = line * (self.terminal_size - 3)
-                            if line == item_lines[full_row] - 1:
-                                assembly_line = f'| {item[full_row][line_shift : ]}{" " * (self.terminal_size - len(item[full_row][line_shift : ]))} |'
-                            else:
-                                assembly_line = f'| {item[full_row][line_shift : line_shift + self.terminal_size]} |'
-                            print(assembly_line)
-                        print(row_splitter)
+    @staticmethod
+    def _cell(value: object) -> str:
+        """Содержимое ячейки строкой, без случайных переходов на новую строку"""
+
+        return str(value).replace('\n', '')
+
+    def _row_lines(self, item: dict) -> Iterator[str]:
+        """Линии, которыми выводится одна строка таблицы, вместе с чертами под ней"""
+
+        # контент во всех колонках, кроме полноширинных, переносим по словам, чтобы влез в колонку,
+        # каждую ячейку - один раз. Необходимо также сохранить первоначальную последовательность
+        # колонок, поэтому идем по self.sequence, а ширины берем из headers
+        cells = [ wrap(item[name], width) for name, width in self._widths ]
+        height = max(map(len, cells))
+        if height == 1:
+            # почти все строки таблицы - в одну линию
+            yield self._row_template.format(*[ wrapped[0] for wrapped in cells ])
         else:
-            print('Нет строк для вывода')
+            # линии уже дополнены пробелами до ширины колонки, а в закончившихся
+            # колонках вместо них пустая ячейка той же ширины
+            for line in range(height):
+                yield self._row_template.format(*[
+                    wrapped[line] if line < len(wrapped) else empty for wrapped, empty in zip(cells, self._empty_cells)
+                ])
+        yield self._row_splitter
+        # для полноширинных все то же самое, только ячейка одна на всю ширину
+        for full_row in self.full_size_rows:
+            # пропуск заголовка, такие колонки его не имеют
+            if (content := item.get(full_row)) is not None:
+                for line in wrap(content, self.terminal_size):
+                    yield f'| {line} |'
+                yield self._row_splitter
+
+    def lines(self) -> Iterator[str]:
+        """Линии готовой таблицы, по одной. Тело таблицы читается по ходу дела"""
+
+        if not self._sample:
+            yield 'Нет строк для вывода'
+            return
+        # Посчитаем параметры будущей таблицы
+        self._get_lengths()
+        self._widths = [ (name, self.headers[name]) for name in self.sequence ]
+        # шаблон линии строки собирается один раз на набор ширин. Ширина в нем
+        # не указывается: format выравнивает по числу символов, а не знакомест
+        self._row_template = '|' + '|'.join([' {} '] * len(self._widths)) + '|'
+        self._empty_cells = [ ' ' * width for _, width in self._widths ]
+        # горизонтальная черта
+        self._row_splitter = '-' * (sum(self.headers.values()) + 1 + self.column_frame * len(self.headers))
+        yield self._row_splitter
+        # заголовки - такая же строка для вывода, только идет первой
+        yield from self._row_lines({ k: self.header_rename.get(k, k) for k in self.headers.keys() })
+        columns = list(self.headers.keys()) + self.full_size_rows
+        for row in self.body:
+            # к строкам приводятся только выводимые колонки
+            yield from self._row_lines({ name: self._cell(row[name]) for name in columns if name in row })
+
+    def printer(self, file: TextIO | None = None) -> None:
+        """Основная функция. Делает красиво. Выводит таблицу в file,
+        по умолчанию - в консоль, пачками по buffer_lines линий"""
+
+        file = sys.stdout if file is None else file
+        buffer = []
+        for line in self.lines():
+            buffer.append(line)
+            if len(buffer) >= self.buffer_lines:
+                file.write('\n'.join(buffer) + '\n')
+                buffer.clear()
+        if buffer:
+            file.write('\n'.join(buffer) + '\n')
+        file.flush()
 
 # table = TablePrinter(
 #     ['aaa', 'bbb', ('ccc', 45), ('ddd', 100), 'dsdssasasasas'],
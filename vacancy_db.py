@@ -0,0 +1,574 @@
+import logging
+from datetime import date, timedelta
+from typing import Optional, Iterable, TYPE_CHECKING
+from sqlalchemy import create_engine, select, update, inspect, text, bindparam, literal_column, distinct, event, func, Index, ForeignKey, MappingResult, Engine, Row
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, Session
+from copy import deepcopy
+from hashlib import sha1
+from json import dumps
+from tableprinter import TablePrinter
+from instrumentation import metrics
+from nearduplicates import MinHasher
+from collections import defaultdict, Counter
+from time import perf_counter
+
+# Бд вакансий и вывод из нее. Модуль нужен всем режимам скрипта, поэтому
+# не тянет за собой ничего из http клиентов и разбора страниц
+if TYPE_CHECKING:
+    from vacancy_sources import Vacancy
+
+# логгер модуля. Куда он пишет, настраивается при запуске скрипта
+logger = logging.getLogger(__name__)
+
+# Базовый класс. Просто нужен для ORM
+class Base(DeclarativeBase):
+
+    # добавим возможность сравнивать экземпляры класса на равенство по аттрибутам, кроме id
+    def __eq__(self, other):
+        classes_match = isinstance(other, self.__class__)
+        a, b = deepcopy(self.__dict__), deepcopy(other.__dict__)
+        #compare based on equality our attributes, ignoring SQLAlchemy internal stuff
+        # отпечаток и подпись вычисляются из тех же полей, так что в сравнении они
+        # лишние, как и кластер, который зависит от других вакансий
+        for item in [a, b]:
+            item.pop('_sa_instance_state', None)
+            item.pop('id', None)
+            item.pop('fingerprint', None)
+            item.pop('minhash', None)
+            item.pop('cluster_id', None)
+        # приведем значения обоих инстансов к строкам, чтобы исключить ситуацию,
+        # когда из бд получаем строку, а с сайтов - число
+        for item in [a, b]:
+            for k, v in item.items():
+                item[k] = str(v)
+        attrs_match = (a == b)
+        return classes_match and attrs_match
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+# Класс вакансии для БД. С Optional - строки, в которые можно и не получить информацию из источников
+class VacancyDB(Base):
+    __tablename__ = 'vacancies'
+    # db_reader фильтрует по дате, а выборка свежих вакансий одного
+    # источника - по источнику и дате. Индекс на дату задан тут, а не
+    # в mapped_column, т.к. имя колонки совпадает с типом date
+    __table_args__ = (
+        Index('ix_vacancies_date', 'date'),
+        Index('ix_vacancies_source_type_date', 'source_type', 'date')
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    source_type: Mapped[str]
+    title: Mapped[str]
+    company: Mapped[str]
+    salary: Mapped[Optional[str]]
+    shortdesc: Mapped[Optional[str]]
+    # индекс нужен, чтобы еще до запроса подробных данных отсеивать уже известные вакансии
+    link: Mapped[str] = mapped_column(index=True)
+    date: Mapped[date]
+    experience: Mapped[Optional[str]]
+    fulldesc: Mapped[Optional[str]]
+    # отпечаток содержимого, по нему ищутся дубликаты, и он же не дает записать
+    # дубликат повторно. Optional - т.к. в старых бд колонка добавляется уже
+    # к существующим строкам
+    fingerprint: Mapped[Optional[str]] = mapped_column(index=True, unique=True)
+    # MinHash подпись текста вакансии, и кластер почти одинаковых вакансий -
+    # одна и та же работа на разных сайтах или перевыложенная. Номер кластера -
+    # id самой ранней вакансии в нем, у вакансий без похожих кластера нет
+    minhash: Mapped[Optional[bytes]]
+    cluster_id: Mapped[Optional[int]] = mapped_column(index=True)
+
+    # полнотекстовый индекс, по каким полям он строится, и чем выделять
+    # найденные слова в выдержке из текста
+    search_table = 'vacancies_fts'
+    search_fields = ('title', 'shortdesc', 'fulldesc')
+    search_mark = '*'
+    # строить ли кластеры при записи. Подписи и кластеры - большая часть
+    # времени записи. Вакансии, записанные без них, остаются без minhash
+    # и cluster_id и в кластеры уже не попадут
+    clustering = True
+    # поля, из которых складывается отпечаток - все, кроме id и самого отпечатка
+    content_fields = ('source_type', 'title', 'company', 'salary', 'shortdesc', 'link', 'date', 'experience', 'fulldesc')
+
+    @classmethod
+    def make_fingerprint(cls, values: dict) -> str:
+        """Вычисляет отпечаток вакансии - sha1 от строковых представлений
+        всех содержательных полей. Значения приводятся к строкам так же,
+        как в Base.__eq__, чтобы отпечатки из бд и с сайтов совпадали"""
+        return sha1('\x1f'.join(str(values.get(field)) for field in cls.content_fields).encode()).hexdigest()
+
+    @classmethod
+    def make_minhash(cls, values: dict) -> bytes:
+        """MinHash подпись вакансии по названию, компании и описанию. Описание
+        берется полное, а если его нет - краткое"""
+        return hasher.dump(hasher.signature(' '.join((
+            str(values.get('title') or ''), str(values.get('company') or ''),
+            str(values.get('fulldesc') or values.get('shortdesc') or '')
+        ))))
+
+# LSH индекс почти одинаковых вакансий: для каждой полосы MinHash подписи
+# вакансии - хэш значений полосы. Вакансии, совпавшие хоть в одной полосе, -
+# кандидаты в почти дубликаты, их подписи сравниваются уже целиком
+class VacancyBand(Base):
+    __tablename__ = 'vacancy_bands'
+    # строки ищутся только по первичному ключу, отдельный rowid не нужен
+    __table_args__ = {'sqlite_with_rowid': False}
+    band: Mapped[int] = mapped_column(primary_key=True)
+    bucket: Mapped[int] = mapped_column(primary_key=True)
+    vacancy_id: Mapped[int] = mapped_column(ForeignKey('vacancies.id'), primary_key=True)
+
+# подпись из 64 значений в 16 полосах по 4: кандидатами почти наверняка станут вакансии
+# со сходством от ~0.5, а почти дубликатами считаются от near_duplicate_similarity
+hasher = MinHasher(size=64, bands=16)
+near_duplicate_similarity = 0.7
+# Корзину полосы, в которую попадают сотни вакансий, набивает шаблонный текст,
+# а не перевыложенная вакансия. Из корзины берутся только последние
+# lsh_bucket_limit вакансий, и полностью сравниваются не больше
+# lsh_candidates кандидатов, совпавших в наибольшем числе полос
+lsh_bucket_limit = 50
+lsh_candidates = 10
+# за сколько последних дней строить кластеры для вакансий, записанных до
+# появления кластеров. Перевыкладывают вакансии в пределах пары недель
+cluster_backfill_days = 30
+
+# сколько строк записывать в бд одной транзакцией
+db_write_batch = 1000
+# по скольким первым вакансиям считать ширину колонок таблицы,
+# и сколько читать из бд за раз
+table_page_size = 200
+
+def db_engine(bd_file: str) -> Engine:
+    """Создает подключение к файлу sqlite. Каждое соединение переводится
+    в режим WAL с synchronous=NORMAL: запись не ждет fsync на каждый
+    коммит, а читатели и писатели из разных процессов не блокируют друг друга"""
+    engine = create_engine(f'sqlite+pysqlite:///{bd_file}')
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(connection, _) -> None:
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+    return engine
+
+def _migrate_fingerprint(session: Session) -> None:
+    """Колонка с отпечатками содержимого. Отпечатки старых записей вычисляются тут же"""
+    columns = [ column['name'] for column in inspect(session.connection()).get_columns(VacancyDB.__tablename__) ]
+    if 'fingerprint' in columns:
+        return
+    session.execute(text(f'ALTER TABLE {VacancyDB.__tablename__} ADD COLUMN fingerprint VARCHAR'))
+    rows = session.execute(select(VacancyDB.id, *[ getattr(VacancyDB, field) for field in VacancyDB.content_fields ]))
+    fingerprints = [ {'id': row.id, 'fingerprint': VacancyDB.make_fingerprint(row._asdict())} for row in rows ]
+    # массовое обновление по первичному ключу
+    if fingerprints:
+        session.execute(update(VacancyDB), fingerprints)
+
+def _migrate_indexes(session: Session) -> None:
+    """Индексы под выборки по дате и источнику, отпечаток становится уникальным.
+    Точные копии записей, накопившиеся до этого, удаляются - остается самая ранняя"""
+    deleted = session.execute(text(
+        f'DELETE FROM {VacancyDB.__tablename__} WHERE fingerprint IS NOT NULL AND id NOT IN '
+        f'(SELECT min(id) FROM {VacancyDB.__tablename__} GROUP BY fingerprint)'
+    )).rowcount
+    if deleted:
+        logger.warning(f'Удалено {deleted} точных копий вакансий, оставлены самые ранние записи')
+    # прежний индекс на отпечаток был не уникальным, а называется так же
+    for index in inspect(session.connection()).get_indexes(VacancyDB.__tablename__):
+        if index['column_names'] == ['fingerprint'] and not index['unique']:
+            session.execute(text(f'DROP INDEX {index["name"]}'))
+    # индексы перечислены явно, а не берутся из модели: в ней есть и индексы
+    # колонок, которые добавят только следующие миграции
+    for statement in (
+        f'CREATE INDEX IF NOT EXISTS ix_vacancies_date ON {VacancyDB.__tablename__} (date)',
+        f'CREATE INDEX IF NOT EXISTS ix_vacancies_source_type_date ON {VacancyDB.__tablename__} (source_type, date)',
+        f'CREATE UNIQUE INDEX IF NOT EXISTS ix_vacancies_fingerprint ON {VacancyDB.__tablename__} (fingerprint)',
+        f'CREATE INDEX IF NOT EXISTS ix_vacancies_link ON {VacancyDB.__tablename__} (link)'
+    ):
+        session.execute(text(statement))
+
+def _migrate_search(session: Session) -> None:
+    """Полнотекстовый индекс FTS5 по названию и описаниям вакансий.
+    Сам текст в индексе не хранится, он берется из vacancies, а в актуальном
+    состоянии индекс держат триггеры на вставку, удаление и изменение"""
+    table, fts = VacancyDB.__tablename__, VacancyDB.search_table
+    columns = ', '.join(VacancyDB.search_fields)
+    new_columns = ', '.join(f'new.{field}' for field in VacancyDB.search_fields)
+    old_columns = ', '.join(f'old.{field}' for field in VacancyDB.search_fields)
+    session.execute(text(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, content={table}, '
+        "content_rowid=id, tokenize='unicode61 remove_diacritics 2', prefix='3')"
+    ))
+    session.execute(text(
+        f'CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {fts} (rowid, {columns}) VALUES (new.id, {new_columns}); END'
+    ))
+    session.execute(text(
+        f'CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN '
+        f"INSERT INTO {fts} ({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_columns}); END"
+    ))
+    _create_search_update_trigger(session)
+    # индекс по уже лежащим в бд вакансиям
+    session.execute(text(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')"))
+
+def _create_search_update_trigger(session: Session) -> None:
+    """Триггер, который переиндексирует вакансию при изменении. Только при
+    изменении проиндексированных полей: запись кластеров и подписей не должна
+    удалять и заново вставлять в индекс все описание"""
+    table, fts = VacancyDB.__tablename__, VacancyDB.search_table
+    columns = ', '.join(VacancyDB.search_fields)
+    new_columns = ', '.join(f'new.{field}' for field in VacancyDB.search_fields)
+    old_columns = ', '.join(f'old.{field}' for field in VacancyDB.search_fields)
+    session.execute(text(
+        f'CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {columns} ON {table} BEGIN '
+        f"INSERT INTO {fts} ({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_columns}); "
+        f'INSERT INTO {fts} (rowid, {columns}) VALUES (new.id, {new_columns}); END'
+    ))
+
+def _migrate_clusters(session: Session) -> None:
+    """Подписи MinHash, LSH индекс и кластеры почти одинаковых вакансий.
+    Для уже лежащих в бд вакансий их строит _migrate_cluster_backfill"""
+    table = VacancyDB.__tablename__
+    columns = [ column['name'] for column in inspect(session.connection()).get_columns(table) ]
+    if 'minhash' not in columns:
+        session.execute(text(f'ALTER TABLE {table} ADD COLUMN minhash BLOB'))
+    if 'cluster_id' not in columns:
+        session.execute(text(f'ALTER TABLE {table} ADD COLUMN cluster_id INTEGER'))
+    session.execute(text(f'CREATE INDEX IF NOT EXISTS ix_vacancies_cluster_id ON {table} (cluster_id)'))
+    session.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {VacancyBand.__tablename__} (band INTEGER NOT NULL, bucket INTEGER NOT NULL, '
+        f'vacancy_id INTEGER NOT NULL, PRIMARY KEY (band, bucket, vacancy_id), '
+        f'FOREIGN KEY(vacancy_id) REFERENCES {table} (id)) WITHOUT ROWID'
+    ))
+
+def _migrate_search_trigger(session: Session) -> None:
+    """Триггер полнотекстового индекса срабатывает только на проиндексированные поля"""
+    session.execute(text(f'DROP TRIGGER IF EXISTS {VacancyDB.__tablename__}_fts_update'))
+    _create_search_update_trigger(session)
+
+def _migrate_cluster_backfill(session: Session) -> None:
+    """Кластеры вакансий за последние cluster_backfill_days дней.
+    Идет после _migrate_search_trigger: кластеры записываются в каждую
+    вакансию, и триггер полнотекстового индекса не должен на это срабатывать"""
+    rows = session.execute(
+        select(VacancyDB.id, VacancyDB.title, VacancyDB.company, VacancyDB.shortdesc, VacancyDB.fulldesc)
+        .where(VacancyDB.minhash.is_(None), VacancyDB.date >= date.today() - timedelta(days=cluster_backfill_days))
+        .order_by(VacancyDB.id)
+    ).all()
+    signed = [ {'id': row.id, 'minhash': VacancyDB.make_minhash(row._asdict())} for row in rows ]
+    for batch_start in range(0, len(signed), db_write_batch):
+        batch = signed[batch_start : batch_start + db_write_batch]
+        session.execute(update(VacancyDB), batch)
+        cluster_vacancies(batch, session)
+
+# Миграции схемы бд по порядку. Номер последней примененной хранится в самом
+# файле sqlite (PRAGMA user_version), так что каждая выполняется однажды.
+# Новая бд создается create_all уже в последней версии, поэтому миграции
+# обязаны спокойно проходить и по схеме, где их изменения уже есть. А старая
+# бд проходит их все, поэтому миграция не должна строить схему по текущей
+# модели - только то, что появилось в её версии
+migrations = [
+    _migrate_fingerprint,
+    _migrate_indexes,
+    _migrate_search,
+    _migrate_clusters,
+    _migrate_search_trigger,
+    _migrate_cluster_backfill
+]
+
+def db_upgrade(engine: Engine) -> None:
+    """Доводит бд, созданную прежней версией скрипта, до текущей схемы.
+    create_all такого не умеет, он только создает отсутствующие таблицы"""
+    with Session(engine) as session:
+        version = session.execute(text('PRAGMA user_version')).scalar()
+        for number, migration in enumerate(migrations[version:], version + 1):
+            migration(session)
+            session.execute(text(f'PRAGMA user_version = {number}'))
+            session.commit()
+            logger.info(f'Схема бд обновлена до версии {number}: {migration.__doc__.splitlines()[0]}')
+
+def db_reader(days: int, session: Session) -> MappingResult:
+    """Запрашивает из БД данные за указанное количество дней. Выбираются
+    только колонки, без ORM объектов, и читаются порциями по мере вывода,
+    а не все разом. Повторы одной вакансии схлопываются прямо в запросе:
+    по каждой ссылке, а для почти дубликатов - по кластеру, берется самая
+    ранняя запись, но с самой свежей датой и всеми ссылками через пробел.
+    Предполагается, что сессия подключения к БД создана заранее
+    и живет, пока результат не прочитан"""
+    table = VacancyDB.__table__
+    latest = (
+        select(
+            func.min(table.c.id).label('id'), func.max(table.c.date).label('date'),
+            func.replace(func.group_concat(distinct(table.c.link)), ',', ' ').label('link')
+        )
+        .where(table.c.date >= (date.today() - timedelta(days=days)))
+        # унарный плюс не дает sqlite группировать проходом по всему индексу
+        # на link - вместо этого берется окно по индексу на дату
+        .group_by(func.coalesce(table.c.cluster_id, literal_column(f'+{table.c.link.name}')))
+        .subquery()
+    )
+    columns = [ latest.c[column] if column in ('date', 'link') else table.c[column] for column in VacancyDB.content_fields ]
+    return session.execute(
+        select(*columns).join(latest, table.c.id == latest.c.id).order_by(table.c.id)
+        .execution_options(yield_per=table_page_size)
+    ).mappings()
+
+def db_search(query: str, session: Session, days: int | None = None, sources: list[str] | None = None) -> MappingResult:
+    """Ищет вакансии по полнотекстовому индексу. query - запрос FTS5: слова,
+    "фразы", префиксы вида прог*, OR, NOT. Самые подходящие идут первыми,
+    вместо описания выводится выдержка с найденными словами. Можно
+    ограничить период в днях и источники"""
+    table, fts = VacancyDB.__tablename__, VacancyDB.search_table
+    conditions = [ f'{fts} MATCH :query' ]
+    params = {'query': query}
+    if days is not None:
+        conditions.append(f'{table}.date >= :since')
+        params['since'] = date.today() - timedelta(days=days)
+    if sources:
+        conditions.append(f'{table}.source_type IN :sources')
+        params['sources'] = sources
+    mark = VacancyDB.search_mark
+    statement = text(
+        f'SELECT {table}.title, {table}.company, {table}.salary, {table}.date, {table}.experience, '
+        f'{table}.link, {table}.source_type, '
+        f"snippet({fts}, -1, '{mark}', '{mark}', '…', 16) AS snippet "
+        f'FROM {fts} JOIN {table} ON {table}.id = {fts}.rowid '
+        f'WHERE {" AND ".join(conditions)} ORDER BY rank'
+    )
+    if sources:
+        statement = statement.bindparams(bindparam('sources', expanding=True))
+    return session.execute(statement.execution_options(yield_per=table_page_size), params).mappings()
+
+def latest_stored(links: Iterable[str], session: Session) -> dict[str, Row]:
+    """Последние записи бд по ссылкам - ссылка, зарплата и дата. Ссылок,
+    которых в бд нет, в словаре тоже нет"""
+    links = list(links)
+    stored = {}
+    # пачками, как и в db_writer, из-за ограничения sqlite на количество параметров
+    for chunk_start in range(0, len(links), 500):
+        latest = (
+            select(func.max(VacancyDB.id)).where(VacancyDB.link.in_(links[chunk_start : chunk_start + 500]))
+            .group_by(VacancyDB.link)
+        )
+        for row in session.execute(select(VacancyDB.link, VacancyDB.salary, VacancyDB.date).where(VacancyDB.id.in_(latest))):
+            stored[row.link] = row
+    return stored
+
+def links_known(vacancies: list['Vacancy'], session: Session) -> set[str]:
+    """Выясняет по индексу на link, какие вакансии страницы списка уже лежат
+    в бд, еще до запроса подробных данных, - одним запросом на всю страницу.
+    Вакансия считается известной, если последняя запись по её ссылке
+    совпадает по полям, которые источник отдает уже в списке - зарплате и
+    дате. Если поле в списке не приходит, оно не сравнивается. Изменившуюся
+    вакансию нужно запросить заново. Отдает ссылки известных вакансий"""
+    stored = latest_stored({ vacancy.link for vacancy in vacancies }, session)
+    known = set()
+    for vacancy in vacancies:
+        if (row := stored.get(vacancy.link)) is None:
+            continue
+        # к строкам по той же причине, что и в Base.__eq__
+        if all(not (listed := getattr(vacancy, field)) or str(listed) == str(getattr(row, field)) for field in ('salary', 'date')):
+            known.add(vacancy.link)
+    return known
+
+def db_writer(vacancy_list: list['Vacancy'], session: Session, verify: bool = False) -> list[dict]:
+    """Сравнивает vacancy_list с вакансиями в БД и удаляет дубликаты. После,
+    дописывает новые вакансии в БД и выдает отфильтрованный список,
+    без дубликатов, встреченных в БД. Дубликаты ищутся по уникальному
+    отпечатку содержимого, за любой период - индекс все равно не даст
+    записать копию. При verify совпавшие по отпечатку записи дополнительно
+    сравниваются полностью, через Base.__eq__. Новые вакансии объединяются
+    в кластеры с почти одинаковыми, номер кластера есть и в выдаваемых
+    словарях. Время поиска дубликатов, записи и кластеров идет в метрики.
+    Функция предполагается к использованию в потоках, поэтому предполагается,
+    что сессия подключения к БД создана заранее"""
+    # если на входе пустой лист - делать ничего не надо
+    if not vacancy_list:
+        return []
+    started = perf_counter()
+    # строки для записи, сразу снабженные отпечатком. ORM объекты тут не нужны,
+    # запись идет напрямую через Core. Строка собирается из полей вакансии
+    # сразу со всеми колонками, чтобы словарь потом не перестраивался
+    # одинаковые вакансии внутри самого списка схлопываются по отпечатку
+    rows = {}
+    for item in vacancy_list:
+        row = dict(zip(item.__slots__, item.astuple()), fingerprint=None, minhash=None, cluster_id=None)
+        row['fingerprint'] = VacancyDB.make_fingerprint(row)
+        rows[row['fingerprint']] = row
+    rows = list(rows.values())
+    # сохраним источник вакансий, вдруг все отфильтруем
+    source_type = rows[0]['source_type']
+    fingerprints = [ row['fingerprint'] for row in rows ]
+    # отпечатки вакансий, уже лежащих в бд
+    duplicates = set()
+    # запрашиваем пачками, чтобы не упереться в ограничение sqlite на количество параметров
+    for chunk_start in range(0, len(fingerprints), 500):
+        query = select(VacancyDB if verify else VacancyDB.fingerprint).where(
+            VacancyDB.fingerprint.in_(fingerprints[chunk_start : chunk_start + 500])
+        )
+        if not verify:
+            duplicates.update(session.scalars(query))
+            continue
+        # режим проверки - совпадение отпечатков подтверждаем полным сравнением
+        for stored in session.scalars(query):
+            for row in rows:
+                if row['fingerprint'] == stored.fingerprint:
+                    if VacancyDB(**row) == stored:
+                        duplicates.add(stored.fingerprint)
+                    else:
+                        logger.warning(f'Совпал отпечаток, но не содержимое вакансии {row["link"]}')
+                    break
+    # удаляем дубликаты
+    filtered = [ row for row in rows if row['fingerprint'] not in duplicates ]
+    metrics.add_time(source_type, 'dedup', perf_counter() - started)
+    started = perf_counter()
+    logger.info(f'Отфильтровано {len(vacancy_list) - len(filtered)} дубликатов, полученных из {source_type}')
+    # записываем в бд только свежие данные: executemany пачками по db_write_batch
+    # строк, каждая пачка - своя транзакция, чтобы не держать блокировку бд
+    # на все время записи большой выборки. Если ту же вакансию успел записать
+    # параллельный процесс, конфликт по отпечатку молча пропускается.
+    # id записанных строк нужны для кластеров, их отдает RETURNING
+    by_fingerprint = { row['fingerprint']: row for row in filtered }
+    statement = (
+        insert(VacancyDB.__table__).on_conflict_do_nothing(index_elements=['fingerprint'])
+        .returning(VacancyDB.id, VacancyDB.fingerprint)
+    )
+    # подписи и кластеры замеряются отдельно от самой записи
+    cluster_time = 0.0
+    for batch_start in range(0, len(filtered), db_write_batch):
+        batch = filtered[batch_start : batch_start + db_write_batch]
+        clustered = perf_counter()
+        if VacancyDB.clustering:
+            for row in batch:
+                row['minhash'] = VacancyDB.make_minhash(row)
+        cluster_time += perf_counter() - clustered
+        for row_id, fingerprint in session.execute(statement, batch):
+            by_fingerprint[fingerprint]['id'] = row_id
+        clustered = perf_counter()
+        if VacancyDB.clustering:
+            cluster_vacancies([ row for row in batch if 'id' in row ], session)
+        cluster_time += perf_counter() - clustered
+        session.commit()
+        # подписи нужны были только для кластеров
+        for row in batch:
+            row['minhash'] = None
+    metrics.add_time(source_type, 'db_write', perf_counter() - started - cluster_time)
+    metrics.add_time(source_type, 'cluster', cluster_time)
+    # наружу служебные колонки не нужны, кроме кластера и id. id есть только
+    # у строк, которые записал именно этот вызов, а не параллельный процесс
+    for row in filtered:
+        row.pop('minhash', None)
+    return filtered
+
+def cluster_vacancies(rows: list[dict], session: Session) -> None:
+    """Находит для только что записанных вакансий почти дубликаты в бд и
+    объединяет их в кластер. rows - словари с id и minhash, по порядку записи.
+    Кандидаты берутся из LSH индекса, похожей считается вакансия со сходством
+    подписей от near_duplicate_similarity. Номер кластера дописывается и в
+    rows. Транзакцию завершает вызывающий"""
+    # у пустых подписей полос нет, такие вакансии ни с чем не сравниваются
+    signatures = { row['id']: signature for row in rows if not hasher.is_empty(signature := hasher.load(row['minhash'])) }
+    keys = { vacancy_id: hasher.band_keys(signature) for vacancy_id, signature in signatures.items() }
+    if not keys:
+        return
+    # вакансии бд, попавшие в те же полосы: кто в какой корзине, и их подписи.
+    # Ключи полос всех новых вакансий уходят одним параметром - массивом json
+    # чисел полоса << 32 | корзина, и корзины по ним выбираются одним запросом.
+    # Соединение начинается с массива (CROSS JOIN задает sqlite порядок), так
+    # что каждая корзина ищется по первичному ключу
+    connection = session.connection()
+    probe = dumps(sorted({ band << 32 | bucket for row_keys in keys.values() for band, bucket in row_keys }))
+    buckets = defaultdict(list)
+    for band, bucket, vacancy_id in connection.exec_driver_sql(
+        'SELECT band, bucket, vacancy_id FROM ('
+        'SELECT bands.band, bands.bucket, bands.vacancy_id, '
+        'row_number() OVER (PARTITION BY bands.band, bands.bucket ORDER BY bands.vacancy_id DESC) AS place '
+        f'FROM json_each(?) AS probe CROSS JOIN {VacancyBand.__tablename__} AS bands '
+        'ON bands.band = probe.value >> 32 AND bands.bucket = probe.value & 4294967295'
+        ') WHERE place <= ? ORDER BY vacancy_id',
+        (probe, lsh_bucket_limit)
+    ):
+        buckets[band, bucket].append(vacancy_id)
+    known = {}
+    candidate_ids = list({ vacancy_id for ids in buckets.values() for vacancy_id in ids })
+    for chunk_start in range(0, len(candidate_ids), 500):
+        for vacancy_id, minhash, cluster_id in session.execute(
+            select(VacancyDB.id, VacancyDB.minhash, VacancyDB.cluster_id)
+            .where(VacancyDB.id.in_(candidate_ids[chunk_start : chunk_start + 500]))
+        ):
+            known[vacancy_id] = [hasher.load(minhash), cluster_id]
+    # новые номера кластеров, и вакансий из rows, и ранее записанных
+    clusters = {}
+    for row in rows:
+        if (signature := signatures.get(row['id'])) is None:
+            continue
+        shared_bands = Counter(
+            vacancy_id for key in keys[row['id']] for vacancy_id in buckets.get(key, ())[-lsh_bucket_limit:]
+        )
+        best, best_similarity = None, near_duplicate_similarity
+        for vacancy_id, _ in shared_bands.most_common(lsh_candidates):
+            similarity = hasher.similarity(signature, known[vacancy_id][0])
+            if similarity >= best_similarity:
+                best, best_similarity = vacancy_id, similarity
+        if best is not None:
+            # у кластера номер самой ранней вакансии: если у похожей
+            # кластера еще не было, им становится она сама
+            if known[best][1] is None:
+                known[best][1] = clusters[best] = best
+            clusters[row['id']] = known[best][1]
+        # следующие строки должны видеть эту как кандидата
+        known[row['id']] = [signature, clusters.get(row['id'])]
+        for key in keys[row['id']]:
+            buckets[key].append(row['id'])
+    for row in rows:
+        row['cluster_id'] = clusters.get(row['id'])
+    if clusters:
+        session.execute(update(VacancyDB), [ {'id': vacancy_id, 'cluster_id': cluster_id} for vacancy_id, cluster_id in clusters.items() ])
+    # строк полос в 16 раз больше, чем вакансий, поэтому они пишутся
+    # прямо через драйвер, без сборки словарей параметров
+    connection.exec_driver_sql(
+        f'INSERT OR IGNORE INTO {VacancyBand.__tablename__} (band, bucket, vacancy_id) VALUES (?, ?, ?)',
+        [ (band, bucket, vacancy_id) for vacancy_id, row_keys in keys.items() for band, bucket in row_keys ]
+    )
+
+def latest_by_cluster(vacancy_list: list[dict]) -> list[dict]:
+    """Исключает одинаковые вакансии на случай, если запрос производится
+    за большой период: по каждой ссылке, а для почти дубликатов - по
+    кластеру, остается первая встреченная запись, но с самой свежей датой
+    и всеми ссылками через пробел. Для бд то же самое делает db_reader"""
+    latest = {}
+    # какие записи уже скопированы, чтобы дописывать в копию, а не в исходную
+    merged = set()
+    for item in vacancy_list:
+        key = item.get('cluster_id') or item['link']
+        if (ready_item := latest.get(key)) is None:
+            latest[key] = item
+            continue
+        if key not in merged:
+            ready_item = latest[key] = dict(ready_item)
+            merged.add(key)
+        if item['date'] > ready_item['date']:
+            ready_item['date'] = item['date']
+        if item['link'] not in ready_item['link'].split():
+            ready_item['link'] += ' ' + item['link']
+    logger.info(f'Отброшено {len(vacancy_list) - len(latest)} повторяющихся "свежих" вакансий')
+    return list(latest.values())
+
+def table_writer(vacancies: Iterable[dict], headers: list | None = None, source: str | None = None) -> None:
+    """Выводит на экран вакансии - словари значений колонок VacancyDB.
+    Ширина колонок считается по первым table_page_size вакансиям, остальные
+    выводятся по мере чтения, так что длинная выборка начинает печататься
+    сразу и целиком в памяти не держится. headers - колонки таблицы,
+    если нужны не те, что обычно. Если передан source, время вывода
+    идет в его метрики"""
+    # параметры табличного вывода
+    if headers is None:
+        headers = [('title', 15), ('company', 10), ('salary', 10), 'shortdesc', ('date', 10), ('experience', 5), ('link', 100)]
+    started = perf_counter()
+    try:
+        TablePrinter(headers, vacancies, header_size_matters=True, sample_size=table_page_size).printer()
+    except Exception:
+        logger.exception('tibleprinter вернул ошибку.', exc_info=True)
+    if source is not None:
+        metrics.add_time(source, 'render', perf_counter() - started)
@@ -0,0 +1,1235 @@
+import logging
+import asyncio
+import aiohttp
+from multidict import CIMultiDictProxy
+from bs4 import BeautifulSoup
+from requests import Session as HttpSession
+from datetime import date, timedelta, datetime
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from functools import partial
+from extractors import EXTRACTORS, SoupExtractor, LxmlExtractor
+from ratelimiter import HostLimiter
+from httpcache import HttpCache
+from httpclient import ConnectionStats, client_session, sync_session
+from retry import Retrier
+from parsepool import ParsePool
+from dbthread import DbThread
+from instrumentation import metrics
+from rudates import DateParser
+from vacancy_db import VacancyDB, db_engine, db_writer, latest_by_cluster, latest_stored, links_known, table_writer
+from json import loads
+from typing import Self, Callable, Iterable, AsyncIterator, Awaitable
+from collections import deque
+from operator import attrgetter
+from contextlib import aclosing
+from itertools import count, islice
+from time import monotonic, perf_counter
+from random import uniform
+import shlex
+import signal
+import subprocess
+from multiprocessing import Queue, Lock
+
+# Сбор вакансий с сайтов: разбор страниц источников, конвейер подробных
+# данных, однопроцессный и многопроцессный запуск и режим наблюдения.
+# Запускается из vacancy_watcher_async, которому для чтения из бд все это не нужно
+
+# логгер модуля. Куда он пишет, настраивается при запуске скрипта
+logger = logging.getLogger(__name__)
+
+# ======= работа с источниками ============
+# Собираем данные по вакансии
+class Vacancy:
+    # поля вакансии, в порядке VacancyDB.content_fields. Словаря атрибутов у
+    # экземпляров нет: на больших выборках вакансий в памяти десятки тысяч
+    __slots__ = ('source_type', 'title', 'company', 'salary', 'shortdesc', 'link', 'date', 'experience', 'fulldesc')
+    # все поля разом, без обращения к каждому по имени
+    _values = attrgetter(*__slots__)
+
+    # задание сегодняшней даты и настроек хидеров раз и для всех экземпляров
+    date_now = date.today()
+    # разбор дат со страниц, один на процесс, со своим кэшем
+    date_parser = DateParser()
+    # headers для hh нужен из-а ddos защиты. Без него не выдает результат
+    # для superjob чтобы исключить результаты из других регионов
+    headers ={
+        'get_hh_intermediate_data': {
+            'cookie': ('cfidsgib-w-hh=ghtUNmALYo148wV9aXnXjwilr5M4IpNQ9+DI7j5XWFV1ja3Fp'
+                'OCgGSNz0xUVl8Y1YBFm6wTzzlEfri/bORCfr7gYAUCINK5HwLbZlUQLCp5kJgrZN0vy2EQ'
+                'V/ldnKk7QmAAaZ6ghHpGWV7EDS5teDFiviQnrYwOzEWTCLg=='),
+            'user-agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.3'
+                '6 (KHTML, like Gecko) Chrome/67.0.3396.87 Safari/537.36')
+        },
+        'get_superjob_intermediate_data': {
+            'cookie': ('forceRemoteWorkDisabled=1'),
+            'user-agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.3'
+                '6 (KHTML, like Gecko) Chrome/67.0.3396.87 Safari/537.36')
+            }
+    }
+    # адреса сайтов-источников. Отдельной настройкой, чтобы можно было
+    # подменить их локальным сервером, например для замеров производительности
+    hosts = {
+        'hh': 'https://kirov.hh.ru',
+        'trudkirov': 'https://trudkirov.ru',
+        'trudvsem': 'https://trudvsem.ru',
+        'trudvsem_api': 'http://opendata.trudvsem.ru',
+        'superjob': 'https://kirov.superjob.ru'
+    }
+    # таймауты запросов, т.к. если не задать - пытаться будет бесконечно:
+    # на установку соединения, на ожидание очередной порции ответа, и на
+    # запрос целиком. Зависший хост отсекается за connect_timeout, а не ждет
+    # всего request_timeout
+    connect_timeout = 5
+    read_timeout = 15
+    request_timeout = 40
+    # повторы неудачных запросов источника: попыток на запрос, пауза перед
+    # первым повтором и её потолок, и доля повторов от всех запросов
+    retry_settings = {'attempts': 3, 'base_delay': 0.5, 'max_delay': 8, 'budget_ratio': 0.2}
+    # дублировать запросы подробных данных, ответ на которые задерживается
+    # дольше обычного (p95). Ответ быстрее, но и запросов к сайтам больше
+    hedge_details = False
+    # сессия requests синхронных методов, одна на процесс, создается при первом запросе
+    _http = None
+    # сколько ждать один источник целиком, списки вместе с подробными данными
+    source_timeout = 240
+    # режим наблюдения: раз в сколько секунд опрашивать источник, и на какую
+    # долю интервала случайно сдвигать каждый опрос, чтобы источники не
+    # опрашивались разом и не в одни и те же секунды
+    watch_intervals = {
+        'get_hh_intermediate_data': 300,
+        'get_superjob_intermediate_data': 300,
+        'get_trudkirov_intermediate_data': 900,
+        'get_trudvsem_intermediate_data': 600
+    }
+    watch_jitter = 0.2
+    # ограничения запросов подробных данных по источникам: запросов в секунду,
+    # сколько можно сделать разом и пределы количества одновременных запросов,
+    # между которыми оно подстраивается под ответы хоста. hh банит охотнее всех
+    detail_limits = {
+        'get_hh_intermediate_data': {'rate': 4, 'burst': 2, 'min_concurrency': 1, 'max_concurrency': 5},
+        'get_superjob_intermediate_data': {'rate': 4, 'burst': 2, 'min_concurrency': 1, 'max_concurrency': 5},
+        'get_trudkirov_intermediate_data': {'rate': 8, 'burst': 4, 'min_concurrency': 2, 'max_concurrency': 8},
+        'get_trudvsem_intermediate_data': {'rate': 20, 'burst': 10, 'min_concurrency': 2, 'max_concurrency': 20}
+    }
+    # сколько секунд страница с подробными данными в кэше считается свежей и
+    # отдается без запроса. Потом - условный запрос, при 304 снова берется из кэша
+    detail_cache_ttl = {
+        'get_hh_intermediate_data': 6 * 3600,
+        'get_superjob_intermediate_data': 6 * 3600,
+        'get_trudkirov_intermediate_data': 12 * 3600,
+        'get_trudvsem_intermediate_data': 12 * 3600
+    }
+    # чем разбирать страницы источника: 'soup' - полное дерево BeautifulSoup,
+    # 'lxml' - lxml.html с заранее скомпилированными XPath, в разы быстрее.
+    # Не указанные источники разбираются BeautifulSoup
+    parser_backends = {
+        'hh': 'lxml',
+        'superjob': 'lxml'
+    }
+    # разбирать страницы еще и BeautifulSoup и сверять результаты с выбранным бэкендом
+    verify_parsers = False
+    # где разбирать страницы подробных данных, чтобы разбор не останавливал
+    # цикл событий: 'inline', 'thread' или 'process' (см. ParsePool), и сколько
+    # для этого потоков или процессов. None - по числу ядер
+    parse_executor = 'thread'
+    parse_workers = None
+    # пул разбора, один на процесс, создается при первой странице
+    _parse_pool = None
+    # размер очереди на получение подробных данных. Если потребители не успевают,
+    # разбор списка вакансий приостанавливается
+    detail_queue_size = 20
+    # сколько страниц списка вакансий асинхронные методы запрашивают наперед,
+    # пока разбирается текущая. У trudkirov страница всего одна
+    listing_pages_in_flight = {
+        'get_hh_intermediate_data': 3,
+        'get_trudvsem_intermediate_data': 4,
+        'get_superjob_intermediate_data': 2,
+        'get_trudkirov_intermediate_data': 1
+    }
+
+    def __init__(
+            self,
+            source_type: str,
+            title: str,
+            link: str,
+            company: str='',
+            salary: str='',
+            shortdesc: str='',
+            date: date | str='',
+            experience: str='',
+            fulldesc: str='',
+            ) -> None:
+        # поскольку набор достапных сразу свойств у разных источников отличается,
+        # обьявим все сразу
+        self.source_type = source_type
+        self.title = title
+        self.company = company
+        self.salary = salary
+        self.shortdesc = shortdesc
+        self.link = link
+        self.date = date
+        self.experience = experience
+        self.fulldesc = fulldesc
+
+    def astuple(self) -> tuple:
+        """Значения полей в порядке __slots__"""
+        return self._values(self)
+
+    def asdict(self) -> dict:
+        return dict(zip(self.__slots__, self._values(self)))
+
+    def detail_link(self) -> str:
+        """Ссылка, по которой запрашиваются подробные данные вакансии"""
+        # trudvsem особый случай
+        # поскольку ссылка на вакансию для меня и для компа отличается (json),
+        # сделаем из ссылки на страницу, ссылку на json в api
+        # ссылка на читаемую страницу https://trudvsem.ru/vacancy/card/1027700404797/0cd46ee2-0b4d-11ee-81f4-dbfed3997e57
+        # ссылка на получение json http://opendata.trudvsem.ru/api/v1/vacancies/vacancy/1027700404797/0cd46ee2-0b4d-11ee-81f4-dbfed3997e57
+        if self.source_type == 'trudvsem':
+            return f'{self.hosts["trudvsem_api"]}/api/v1/vacancies/vacancy/{self.link.split("card/")[-1]}'
+        return self.link
+
+    @classmethod
+    def http(cls) -> HttpSession:
+        """Сессия requests синхронных методов. Соединения с хостом держатся
+        открытыми, а не открываются заново на каждую страницу"""
+        if cls._http is None:
+            cls._http = sync_session()
+        return cls._http
+
+    @classmethod
+    def http_stats(cls) -> ConnectionStats | None:
+        """Счетчики соединений сессии requests, или None, если синхронные
+        методы в этом процессе ничего не запрашивали"""
+        if cls._http is None:
+            return None
+        stats = ConnectionStats()
+        stats.add_sync(cls._http)
+        return stats
+
+    @classmethod
+    def parse_pool(cls) -> ParsePool:
+        """Пул, в котором разбираются страницы подробных данных"""
+        if cls._parse_pool is None:
+            cls._parse_pool = ParsePool(
+                cls.parse_executor, cls.parse_workers, cls._configure_parsing, (cls.parser_backends, cls.verify_parsers)
+            )
+        return cls._parse_pool
+
+    @classmethod
+    def close_parse_pool(cls) -> None:
+        """Останавливает пул разбора и пишет в лог его статистику, если
+        пул в этом процессе создавался. Следующая страница создаст его заново"""
+        if cls._parse_pool is not None:
+            logger.info(f'Разбор страниц: {cls._parse_pool}')
+            cls._parse_pool.close()
+
+    @classmethod
+    def _configure_parsing(cls, parser_backends: dict, verify_parsers: bool) -> None:
+        """Настройки разбора в процессе пула, который запущен с нуля"""
+        cls.parser_backends = parser_backends
+        cls.verify_parsers = verify_parsers
+
+    @classmethod
+    def client_timeout(cls) -> aiohttp.ClientTimeout:
+        """Таймауты асинхронного запроса по фазам"""
+        return aiohttp.ClientTimeout(total=cls.request_timeout, sock_connect=cls.connect_timeout, sock_read=cls.read_timeout)
+
+    @classmethod
+    def retrier(cls) -> Retrier:
+        """Повторы запросов для одного источника, бюджет у каждого свой"""
+        return Retrier(**cls.retry_settings, hedge=cls.hedge_details)
+
+    @staticmethod
+    def get_element_or_empty(element: BeautifulSoup, selector: str) -> str:
+        """Вспомогательная функция. Ищет элементы по заданным фильтрам (тип элемента,
+        свойство), возвращает текст из элемента, или пустую строку"""
+        return tmp.getText() if (tmp := element.select_one(selector)) else ''
+
+    @classmethod
+    def bad_status_code(cls, status_code: int, req_info: str, print_warn: bool = False) -> bool:
+        """Проверяет статус код, пишел в лог если это не 200 и возвращает False,
+        если все хорошо, и True в противном случае"""
+        if status_code != 200:
+            out_string = f'Статус код не 200, а {status_code}. Дополнительная информация: {req_info}'
+            logger.warning(out_string)
+            # сообщение в косоль о том, что данные, например для всего списка, не получены
+            if print_warn:
+                print(out_string)
+            return True
+        return False
+
+    @classmethod
+    async def _prefetch_pages(cls, session: aiohttp.ClientSession, urls: Iterable[str], in_flight: int,
+                              req_info: str, as_json: bool = False, headers: dict | None = None,
+                              retrier: Retrier | None = None, source: str = '') -> AsyncIterator[str | dict | None]:
+        """Асинхронно запрашивает страницы списка по порядку, держа наперед
+        до in_flight запросов, пока разбирается текущая страница. Отдает тело
+        страницы, либо None, если статус код плохой. Запросы, которые так и
+        не понадобились, отменяются при закрытии генератора. headers передаются
+        с каждым запросом, т.к. сессия может быть общей для всех источников.
+        Неудачный запрос повторяется через retrier, прежде чем бросить источник.
+        Время и объем запросов идут в метрики источника source"""
+        retrier = retrier or cls.retrier()
+        async def request(url: str) -> tuple[int, str | dict | None]:
+            async with session.get(url, headers=headers, timeout=cls.client_timeout()) as response:
+                metrics.add_bytes(source, len(await response.read()))
+                if response.status != 200:
+                    return response.status, None
+                # trudvsem отдает json, но не всегда с правильным content-type
+                return 200, await response.json(content_type=None) if as_json else await response.text()
+        async def fetch(url: str) -> str | dict | None:
+            with metrics.timer(source, 'listing_fetch'):
+                status, body = await retrier.call(partial(request, url))
+            if cls.bad_status_code(status, req_info, True):
+                return None
+            return body
+        urls = iter(urls)
+        # запросы в полете, в порядке страниц
+        pending = deque(asyncio.create_task(fetch(url)) for url in islice(urls, max(in_flight, 1)))
+        try:
+            while pending:
+                body = await pending.popleft()
+                # пока потребитель разбирает эту страницу, следующая уже запрашивается
+                if (url := next(urls, None)) is not None:
+                    pending.append(asyncio.create_task(fetch(url)))
+                yield body
+        finally:
+            for task in pending:
+                task.cancel()
+            # дожидаемся отмены, чтобы ошибки ненужных запросов не повисли без обработки
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    @classmethod
+    def _hh_url(cls, days: int, page: int) -> str:
+        """Ссылка на страницу списка вакансий hh"""
+        return (f'{cls.hosts["hh"]}/search/vacancy?a'
+            'rea=49&enable_snippets=true&ored_clusters=true&professional_rol'
+            'e=156&professional_role=160&professional_role=10&professional_r'
+            'ole=12&professional_role=150&professional_role=25&professional_'
+            'role=165&professional_role=34&professional_role=36&professional'
+            '_role=73&professional_role=155&professional_role=96&professiona'
+            'l_role=164&professional_role=104&professional_role=157&professi'
+            'onal_role=107&professional_role=112&professional_role=113&profe'
+            'ssional_role=148&professional_role=114&professional_role=116&pr'
+            'ofessional_role=121&professional_role=124&professional_role=125'
+            f'&professional_role=126&search_period={days}&page={page}')
+
+    @classmethod
+    def _parse_with_backend(cls, source: str, extract: Callable, *args) -> object:
+        """Разбирает страницу бэкендом, выбранным для источника в parser_backends.
+        В режиме проверки разбирает её еще и эталонным BeautifulSoup, и если
+        результаты разошлись - пишет в лог"""
+        backend = cls.parser_backends.get(source, 'soup')
+        result = extract(EXTRACTORS[backend], *args)
+        if cls.verify_parsers and backend != 'soup':
+            # вакансии сравниваем по содержимому
+            comparable = lambda item: [ one.asdict() for one in item ] if isinstance(item, list) else item
+            if comparable(result) != comparable(reference := extract(EXTRACTORS['soup'], *args)):
+                logger.warning(f'Разбор {source} бэкендом {backend} разошелся с BeautifulSoup: {comparable(result)} != {comparable(reference)}')
+        return result
+
+    @classmethod
+    def _parse_hh_page(cls, text: str) -> list[Self] | None:
+        """Разбирает одну страницу списка hh. None - если вакансий на
+        странице нет, т.е. страницы кончились"""
+        return cls._parse_with_backend('hh', cls._extract_hh_page, text)
+
+    @classmethod
+    def _extract_hh_page(cls, extractor: SoupExtractor | LxmlExtractor, text: str) -> list[Self] | None:
+        """Алгоритм разбора страницы списка hh, общий для всех бэкендов"""
+        one_page = extractor.document(text)
+        vacancy_items = extractor.find_all(one_page, 'hh_card')
+        if not vacancy_items:
+            return None
+        result = []
+        # Возвращаем словари с ключами: титул, зарплата, кампания, краткое описание, ссылка
+        for vacancy in vacancy_items:
+            # ссылки на вакансию не должно не быть.. но разик случилось
+            # что сайт поменяли, так что защита
+            if (link := extractor.find(vacancy, 'hh_link')) is not None:
+                link = extractor.attr(link, 'href').split('?')[0]
+            else:
+                link = 'Couldnt get a link'
+            result.append(Vacancy(
+                source_type = 'hh',
+                title = extractor.text_or_empty(vacancy, 'hh_title'),
+                salary = extractor.text_or_empty(vacancy, 'hh_salary'),
+                company = extractor.text_or_empty(vacancy, 'hh_company'),
+                link=link,
+                shortdesc = extractor.text_or_empty(vacancy, 'hh_shortdesc')
+            ))
+        return result
+
+    @classmethod
+    def _parse_hh_detail(cls, text: str) -> dict:
+        """Разбирает страницу вакансии hh, возвращает опыт, полное описание и дату"""
+        return cls._parse_with_backend('hh', cls._extract_hh_detail, text)
+
+    @classmethod
+    def _extract_hh_detail(cls, extractor: SoupExtractor | LxmlExtractor, text: str) -> dict:
+        """Алгоритм разбора страницы вакансии hh, общий для всех бэкендов"""
+        soup = extractor.document(text)
+        return {
+            'experience': extractor.text_or_empty(soup, 'hh_experience'),
+            'fulldesc': extractor.text_or_empty(soup, 'hh_fulldesc'),
+            'date': cls._date_from_string(extractor.text_or_empty(soup, 'hh_date'), 'hh')
+        }
+
+    @classmethod
+    def get_hh_intermediate_data(cls, days: int) -> list[Self]:
+        """Проходится по всем страницам с результатом, выбирая все полезные данные"""
+        result = []
+        try:
+            page = 0
+            while True:
+                one_page = cls.http().get(cls._hh_url(days, page), headers=cls.headers['get_hh_intermediate_data'], timeout=(cls.connect_timeout, cls.read_timeout))
+                # если ничего не получили, нечего и обрабаотывать
+                if cls.bad_status_code(one_page.status_code, 'функция get_hh_intermediate_data', True):
+                    return result
+                # если даже на одной странице ничего нет, значит возвращаем то, что есть
+                if (vacancies := cls._parse_hh_page(one_page.text)) is None:
+                    logger.info(f'Получен список из {len(result)} вакансий')
+                    return result
+                result.extend(vacancies)
+                page += 1
+        except Exception as e:
+            print('Ошибка получения списка вакансий', e)
+            logger.exception('Произошла ошибка при получении списка вакансий')
+        return result
+
+    @classmethod
+    async def get_hh_intermediate_data_async(cls, session: aiohttp.ClientSession, days: int, retrier: Retrier | None = None) -> AsyncIterator[list[Self]]:
+        """Асинхронный вариант get_hh_intermediate_data. Отдает вакансии списком
+        на каждую страницу, сразу по мере её разбора. Количество страниц заранее неизвестно,
+        так что наперед запрашиваются следующие по номеру, лишние отменяются,
+        как только попадется пустая"""
+        try:
+            pages = cls._prefetch_pages(
+                session, (cls._hh_url(days, page) for page in count()),
+                cls.listing_pages_in_flight['get_hh_intermediate_data'], 'функция get_hh_intermediate_data_async',
+                headers=cls.headers['get_hh_intermediate_data'], retrier=retrier, source='hh'
+            )
+            async with aclosing(pages):
+                async for one_page in pages:
+                    # плохой статус код
+                    if one_page is None:
+                        break
+                    with metrics.timer('hh', 'listing_parse'):
+                        vacancies = cls._parse_hh_page(one_page)
+                    # страницы кончились
+                    if vacancies is None:
+                        break
+                    yield vacancies
+        except Exception as e:
+            print('Ошибка получения списка вакансий', e)
+            logger.exception('Произошла ошибка при получении списка вакансий')
+
+    @classmethod
+    def _trudkirov_url(cls, days: int) -> str:
+        """Ссылка на страницу списка вакансий trudkirov"""
+        return (f'{cls.hosts["trudkirov"]}/vacancy/?WithoutAdditionalLimits=Fals'
+            'e&ActivityScopeNoStandart=True&ActivityScope=97&SearchType=2&Region=43'
+            '&AreaFiasOktmo=77612&HideWithEmptySalary=False&ShowOnlyWithEmployerInf'
+            'o=False&ShowOnlyWithHousing=False&ShowChukotkaResidentsVacancies=False'
+            '&ShowPrimorskAreaResident1Vacancies=False&ShowPrimorskAreaResident2Vac'
+            'ancies=False&ShowPrimorskAreaResident3Vacancies=False&StartDate='
+            f'{(cls.date_now - timedelta(days=days)).strftime("%d.%m.%Y")}&Sort=1&P'
+            'ageSize=1000&SpecialCategories=False&IsDevelopmentProgram=False')
+
+    @classmethod
+    def _parse_trudkirov_page(cls, text: str) -> list[Self]:
+        """Разбирает страницу списка trudkirov"""
+        result = []
+        soup = BeautifulSoup(text, 'lxml')
+        # Ищем таблицу с вакансиями. У нее нет отличительных аттрибутов, но на данный момент
+        # она единственная содержит tbody на странице
+        vacancies = soup.find('tbody')
+        # Если 0 результатов, то будет таблица с данным классом в tr
+        if vacancies is None or vacancies.select('.k-no-data'):
+            return result
+        vacancies = vacancies.find_all('tr')
+        # Инициализируем элемент класса с полями: титул, зарплата, кампания, дата, ссылка
+        for vacancy in vacancies:
+            result.append(Vacancy(
+                source_type = 'trudkirov',
+                title = vacancy.contents[0].getText(),
+                salary = vacancy.contents[1].getText(),
+                company = vacancy.contents[3].getText(),
+                date = cls._date_from_string(vacancy.contents[4].getText(), 'trudkirov'),
+                # ссылки на вакансию не должно не быть. Также сократим её до тольконеобходимых данных
+                link = f"{cls.hosts['trudkirov']}{vacancy.contents[0].find('a').attrs['href']}".partition('?returnurl=')[0],
+            ))
+        return result
+
+    @classmethod
+    def get_trudkirov_intermediate_data(cls, days: int) -> list[Self]:
+        """Запрашивает сразу страницу с 1000 результатов, столько все равно вряд ли будет.
+        Используем простой requests, т.к. он тут работает и быстрее селениума"""
+        result = []
+        try:
+            page = cls.http().get(cls._trudkirov_url(days), timeout=(cls.connect_timeout, cls.read_timeout))
+            # если ничего не получили, нечего обрабатывать
+            if cls.bad_status_code(page.status_code, 'get_trudkirov_intermediate_data', True):
+                return result
+            result = cls._parse_trudkirov_page(page.text)
+            logger.info(f'Получен список из {len(result)} вакансий')
+        except Exception:
+            print('Ошибка получения списка вакансий')
+            logger.exception('Произошла ошибка при получении списка вакансий')
+        return result
+
+    @classmethod
+    async def get_trudkirov_intermediate_data_async(cls, session: aiohttp.ClientSession, days: int, retrier: Retrier | None = None) -> AsyncIterator[list[Self]]:
+        """Асинхронный вариант get_trudkirov_intermediate_data, отдает вакансии
+        списком на страницу. Страница всего одна, так что и запрашивать наперед нечего"""
+        try:
+            pages = cls._prefetch_pages(
+                session, [cls._trudkirov_url(days)], 1, 'get_trudkirov_intermediate_data_async', retrier=retrier, source='trudkirov'
+            )
+            async with aclosing(pages):
+                async for page in pages:
+                    if page is None:
+                        break
+                    with metrics.timer('trudkirov', 'listing_parse'):
+                        vacancies = cls._parse_trudkirov_page(page)
+                    yield vacancies
+        except Exception:
+            print('Ошибка получения списка вакансий')
+            logger.exception('Произошла ошибка при получении списка вакансий')
+
+    @classmethod
+    def _trudvsem_url(cls, days: int, page_num: int) -> str:
+        """Ссылка на страницу списка вакансий trudvsem. В отдельные дни сайт не умеет,
+        может только день, три, неделя, месяц, все"""
+        match days:
+            # 0 или 1, в общем сегодня
+            case _ if days < 2:
+                exp = 'EXP_0'
+            # 3 дня
+            case _ if days < 4:
+                exp = 'EXP_1'
+            # неделя
+            case _ if days < 8:
+                exp = 'EXP_2'
+            # месяц. Не всегда будет точно, но вряд ли буду исползовать
+            case _ if days < 32:
+                exp = 'EXP_3'
+            # все время
+            case _:
+                exp = 'EXP_MAX'
+        return (f'{cls.hosts["trudvsem"]}/iblocks/_catalog/flat_filter_prr_search_vacancies/data?'
+            'filter=%7B%22regionCode%22%3A%5B%224300000000000%22%5D%2C%22districts%22%3A'
+            '%5B%224300000100000%22%5D%2C%22professionalSphere%22%3A%5B%22InformationTec'
+            f'hnology%22%5D%2C%22publishDateTime%22%3A%5B%22{exp}%22%5D%7D&orderColumn=RE'
+            f'LEVANCE_DESC&page={page_num}&pageSize=10')
+
+    @classmethod
+    def _parse_trudvsem_page(cls, page: dict) -> list[Self]:
+        """Разбирает страницу списка trudvsem, уже полученную в виде json"""
+        result = []
+        # цикл по вакансиям на странице
+        for vacancy in page['result']['data']:
+            result.append(Vacancy(
+                source_type = 'trudvsem',
+                title = vacancy[1],
+                company = vacancy[3],
+                date = datetime.fromtimestamp(int(str(vacancy[23])[:10])).date(),
+                link = f'{cls.hosts["trudvsem"]}/vacancy/card/{vacancy[2]}/{vacancy[0]}'
+            ))
+        return result
+
+    @classmethod
+    def get_trudvsem_intermediate_data(cls, days: int) -> list[Self]:
+        """Запрашивает данные с trudvsem. Не отдает более
+        10 вакансий за раз. Более подробную информацию по вакансии получаем
+        по api в дальнейшем"""
+        def get_new_page(page_num: int) -> dict | None:
+            """Запрашивает страницу с заданными: количеством дней со дня
+            публикации и номером страницы"""
+            new_page = cls.http().get(cls._trudvsem_url(days, page_num), timeout=(cls.connect_timeout, cls.read_timeout))
+            # если ничего не получили, нечего обрабатывать
+            if cls.bad_status_code(new_page.status_code, 'get_trudvsem_intermediate_data', True):
+                return None
+            return new_page.json()            
+        result = []
+        try:
+            # запросим цикл на 1000 страниц, вряд ли столько там будет
+            for pg in range(100):
+                page = get_new_page(pg)
+                # если плохой статус код или нет данных по вакансиям - на выход
+                if page is None or not page['result']['data']:
+                    return result
+                result.extend(cls._parse_trudvsem_page(page))
+                # Если страница последняя - выход
+                if pg == page['result']['paging']['pages'] - 1:
+                    break
+            logger.info(f'Получен список из {len(result)} вакансий')
+        except Exception:
+            print('Ошибка получения списка вакансий')
+            logger.exception('Произошла ошибка при получении списка вакансий')
+        return result
+
+    @classmethod
+    async def get_trudvsem_intermediate_data_async(cls, session: aiohttp.ClientSession, days: int, retrier: Retrier | None = None) -> AsyncIterator[list[Self]]:
+        """Асинхронный вариант get_trudvsem_intermediate_data, отдает вакансии списком на страницу"""
+        try:
+            pages = cls._prefetch_pages(
+                session, (cls._trudvsem_url(days, pg) for pg in range(100)),
+                cls.listing_pages_in_flight['get_trudvsem_intermediate_data'], 'get_trudvsem_intermediate_data_async', as_json=True,
+                retrier=retrier, source='trudvsem'
+            )
+            async with aclosing(pages):
+                for pg in count():
+                    page = await anext(pages, None)
+                    # если плохой статус код или нет данных по вакансиям - на выход
+                    if page is None or not page['result']['data']:
+                        break
+                    with metrics.timer('trudvsem', 'listing_parse'):
+                        vacancies = cls._parse_trudvsem_page(page)
+                    yield vacancies
+                    # Если страница последняя - выход, запрошенные наперед отменятся
+                    if pg == page['result']['paging']['pages'] - 1:
+                        break
+        except Exception:
+            print('Ошибка получения списка вакансий')
+            logger.exception('Произошла ошибка при получении списка вакансий')
+
+    @classmethod
+    def _superjob_url(cls, days: int, page: int) -> str:
+        """Ссылка на страницу списка вакансий superjob"""
+        return (f'{cls.hosts["superjob"]}/vakansii/it-internet-svyaz-telekom/?period='
+            f'{cls._superjob_period(days)}&click_from=facet&page={page}')
+
+    @staticmethod
+    def _superjob_period(days: int) -> int:
+        """В отдельные дни сайт не умеет, можно запрашивать за один, три
+        или семь дней. Если неверно указать дни, выдает непонятно что."""
+        match days:
+            # 0 или 1, в общем сегодня
+            case _ if days < 2:
+                return 1
+            # 3 дня
+            case _ if days < 4:
+                return 3
+            # неделя
+            case _:
+                return 7
+
+    @classmethod
+    def _parse_superjob_page(cls, text: str, days: int) -> list[Self] | None:
+        """Разбирает одну страницу списка superjob. None - если страница пустая"""
+        return cls._parse_with_backend('superjob', cls._extract_superjob_page, text, days)
+
+    @classmethod
+    def _extract_superjob_page(cls, extractor: SoupExtractor | LxmlExtractor, text: str, days: int) -> list[Self] | None:
+        """Алгоритм разбора страницы списка superjob, общий для всех бэкендов"""
+        days = cls._superjob_period(days)
+        result = []
+        soup = extractor.document(text)
+        yesterday_str = date.today() - timedelta(days=1)
+        # немного про особенности сайта. Он выдает список результатов, где нужный регион просто
+        # сверху, а дальше идут остальные, т.е. надо вовремя остановитсья.
+        # также выдает рекламу типа "курс" или проплаченных вакансий
+        # дата вакансии также приводится в виде "сегодня", "вчера"
+        # большинство классов также автогенерированные, так что и зацепиться почти не за что
+        # придется считать спаны
+        vacancies = extractor.find_all(soup, 'sj_card')
+        # пустая страница
+        if not vacancies:
+            return None
+        for vacancy in vacancies:
+            # пропустим проплаченную вакансию, у нее зеленая обводка, заданная стилем
+            if extractor.find(vacancy, 'sj_paid') is not None:
+                continue
+            # у первого спана нет узнаваемого аттрибута, но он важен, т.к. содержит дату или курс
+            first_span = extractor.find(vacancy, 'sj_span')
+            # если по какой-то причине нет ни одного спана - нам брать там нечего
+            if first_span is None:
+                continue
+            vacancy_date = extractor.text(first_span)
+            # курс - просто реклама, "Вакансии из соседних городов" - просто надпись
+            # остальные даты преобразовываем в объект
+            match vacancy_date:
+                case 'Курс' | 'Вакансии из соседних городов':
+                    continue
+                case _ if 'Сегодня' in vacancy_date:
+                    vacancy_date = cls.date_now
+                case 'Вчера':
+                    vacancy_date = yesterday_str
+                case _:
+                    vacancy_date = cls._date_from_string(vacancy_date, 'superjob')
+            city = extractor.text_or_empty(vacancy, 'sj_city')
+            # если киров кончился - останов
+            # если нет города - очередная реклама
+            if not city:
+                continue
+            if 'Киров (Кировская область)' not in city:
+                break
+            # также, если вышли за заданную дату - тоже останов
+            if vacancy_date < cls.date_now - timedelta(days=days):
+                break
+            title_and_link = extractor.find(vacancy, 'sj_link')
+            this_vacancy = Vacancy(
+                source_type = 'superjob',
+                title = extractor.text(title_and_link),
+                link = f'{cls.hosts["superjob"]}{extractor.attr(title_and_link, "href")}'
+            ) 
+            this_vacancy.salary = extractor.text_or_empty(vacancy, 'sj_salary')
+            this_vacancy.company = extractor.text_or_empty(vacancy, 'sj_company')
+            this_vacancy.date = vacancy_date
+            # поскольку опереться почти не на что, то будем собирать от кнопки "подать резюме"
+            # но уйдя повыше на 5 родительских элементов, и вверх до слова Киров
+            if (proper_parent := extractor.find(vacancy, 'sj_button')) is not None:
+                for _ in range(5):
+                    proper_parent = extractor.parent(proper_parent)
+                # нужно получить текст от его двух предыдущих сиблингов и частично от
+                # предпредыдущего. Максимум таких сиблингов 3, но на всякий случай возмем 4
+                # и вовремя остановимся
+                for _ in range(3):
+                    proper_parent = extractor.previous_sibling(proper_parent)
+                    if (bages := extractor.find_all(proper_parent, 'sj_badge')) and bages is not None:
+                        this_vacancy.shortdesc = '. '.join([ extractor.text(bage) for bage in bages ]) + '. ' + this_vacancy.shortdesc
+                        break
+                    this_vacancy.shortdesc = extractor.text(proper_parent) + this_vacancy.shortdesc
+            result.append(this_vacancy)
+        return result
+
+    @classmethod
+    def _parse_superjob_detail(cls, text: str) -> dict:
+        """Разбирает страницу вакансии superjob, возвращает опыт и полное описание"""
+        return cls._parse_with_backend('superjob', cls._extract_superjob_detail, text)
+
+    @classmethod
+    def _extract_superjob_detail(cls, extractor: SoupExtractor | LxmlExtractor, text: str) -> dict:
+        """Алгоритм разбора страницы вакансии superjob, общий для всех бэкендов"""
+        details = {}
+        soup = extractor.document(text)
+        # из дополнительной информации можно подчерпнуть только опыт работы и полное описание
+        # оно обычно идет после class="f-test-address", если есть
+        # если ничего не получили, нечего обрабатывать
+        # найдем адрес (регион)
+        city = extractor.find(soup, 'sj_address')
+        if city is not None:
+            features = extractor.next_sibling(city)
+            if features is not None:
+                # Опыт работы не требуется, неполный рабочий день, удалённая работа
+                features = extractor.text(features)
+                # добавим их в полное описание
+                details['fulldesc'] = features
+                # вычленим опыт, если имеется
+                features = features.split(',')
+                for feature in features:
+                    if 'опыт' in feature.lower():
+                        details['experience'] = feature
+                        break
+        # найдем полное описание. описание вообще всего находится в div с классом
+        # f-test-vacancy-base-info, интересующее нас описание - во втором потомке
+        # второго его потомка. Списки superjob полного описания не дают,
+        # так что дописывать есть куда только к особенностям выше
+        base_info = extractor.find(soup, 'sj_base_info')
+        if base_info is not None and len(base_contents := extractor.contents(base_info)) > 2:
+            second_sibling = extractor.contents(base_contents[1])
+            if len(second_sibling) > 2:
+                details['fulldesc'] = details.get('fulldesc', '') + extractor.text(second_sibling[1])
+        return details
+
+    @classmethod
+    def get_superjob_intermediate_data(cls, days: int) -> list[Self]:
+        """Запрашивает данные с superjob, апи нет."""
+        result = []
+        try:
+            # возмем по максимуму 5 страниц, вряд ли больше будет
+            for pg in range(1, 6): 
+                page = cls.http().get(cls._superjob_url(days, pg), headers=cls.headers['get_superjob_intermediate_data'],
+                            timeout=(cls.connect_timeout, cls.read_timeout))
+                # если ничего не получили, нечего обрабатывать
+                if cls.bad_status_code(page.status_code, 'get_trudvsem_intermediate_data', True):
+                    return result
+                # пустая страница
+                if (vacancies := cls._parse_superjob_page(page.text, days)) is None:
+                    break
+                result.extend(vacancies)
+            logger.info(f'Получен список из {len(result)} вакансий')
+        except Exception:
+            print('Ошибка получения списка вакансий')
+            logger.exception('Произошла ошибка при получении списка вакансий')
+        return result
+
+    @classmethod
+    async def get_superjob_intermediate_data_async(cls, session: aiohttp.ClientSession, days: int, retrier: Retrier | None = None) -> AsyncIterator[list[Self]]:
+        """Асинхронный вариант get_superjob_intermediate_data, отдает вакансии списком на страницу"""
+        try:
+            pages = cls._prefetch_pages(
+                session, (cls._superjob_url(days, pg) for pg in range(1, 6)),
+                cls.listing_pages_in_flight['get_superjob_intermediate_data'], 'get_superjob_intermediate_data_async',
+                headers=cls.headers['get_superjob_intermediate_data'], retrier=retrier, source='superjob'
+            )
+            async with aclosing(pages):
+                async for page in pages:
+                    if page is None:
+                        break
+                    with metrics.timer('superjob', 'listing_parse'):
+                        vacancies = cls._parse_superjob_page(page, days)
+                    if vacancies is None:
+                        break
+                    yield vacancies
+        except Exception:
+            print('Ошибка получения списка вакансий')
+            logger.exception('Произошла ошибка при получении списка вакансий')
+                  
+    @classmethod
+    def _date_from_string(cls, somedate: str, source: str) -> date:
+        """Ищет в строке дату и пытается её распарсить в date объект"""
+        # если не получилось, то возвращаем текущую дату, а ошибку просто в лог
+        date = cls.date_parser.parse(somedate, cls.date_now)
+        if date is None:
+            logger.info(f'Произошла ошибка при конвертации даты. Полученная строка - "{somedate}", сайт-источник - "{source}"')
+            return cls.date_now
+        # иногда бывает что с датами на сайтах ошибаются и ставят из будущего
+        # это ломает логику, так что берем седняшную дату вместо этого
+        return date if date <= cls.date_now else cls.date_now
+
+    @classmethod
+    def _parse_detail_on(cls, today: date, source_type: str, page: str, link: str) -> dict | None:
+        """_parse_detail для пула разбора. Процесс пула живет, пока живет пул,
+        и в режиме наблюдения переживает полночь - поэтому сегодняшнюю дату,
+        от которой разбираются даты страниц, передает ему каждая задача"""
+        cls.date_now = today
+        return cls._parse_detail(source_type, page, link)
+
+    @classmethod
+    def _parse_detail(cls, source_type: str, page: str, link: str) -> dict | None:
+        """Разбирает страницу с подробными данными вакансии. Возвращает словарь
+        только с теми полями, которые удалось найти, или None, если по ссылке
+        вакансии не оказалось вовсе"""
+        details = {}
+        match source_type:
+            case 'hh':
+                details = cls._parse_hh_detail(page)
+            case 'trudkirov':
+                soup = BeautifulSoup(page, 'lxml')
+                dts = soup.find_all('dt')
+                description = {
+                    'duties': '',
+                    'additional': ''
+                }
+                for dt in dts:
+                    match dt.getText():
+                        case 'Стаж': details['experience'] = dt.find_next_sibling('dd').getText()
+                        case 'Должностные обязанности': description['duties'] = f"Должностные обязанности: {dt.find_next_sibling('dd').getText()}"
+                        case 'Дополнительные пожелания': description['additional'] = f"Дополнительные пожелания: {dt.find_next_sibling('dd').getText()}"
+                details['fulldesc'] = '\n'.join(description.values())
+                details['shortdesc'] = description['duties'] if len(description['duties']) < 400 else description['duties'][:400]
+            case 'trudvsem':
+                # trudvsem исключение, там мы получаем json
+                page = loads(page)['results']['vacancies']
+                if len(page) > 1:
+                    logger.warning(f'По ссылке {link} пришло несколько вакансий')
+                elif len(page) < 1:
+                    logger.warning(f'По ссылке {link} не пришло вакансий')
+                    return None
+                details['salary'] = page[0]['vacancy']['salary']
+                details['fulldesc'] = BeautifulSoup(page[0]['vacancy']['duty'], 'lxml').getText()
+                details['shortdesc'] = details['fulldesc'] if len(details['fulldesc']) < 400 else details['fulldesc'][:400]
+                details['experience'] = page[0]['vacancy']['requirement']['experience']
+                # details['date'] = cls._date_from_string(page[0]['vacancy']['creation-date'])
+            case 'superjob':
+                details = cls._parse_superjob_detail(page)
+        return details
+
+    # все методы, которые пойдут в параллельные процессы
+    @classmethod
+    def methods(cls) -> list[Callable]:
+        """Возвращает все имеющиеся методы, предназначенные для получения данных"""
+        return [
+            cls.get_hh_intermediate_data,
+            cls.get_trudvsem_intermediate_data,
+            cls.get_superjob_intermediate_data,
+            cls.get_trudkirov_intermediate_data
+        ]
+
+async def fetch_detail(
+        session: aiohttp.ClientSession,
+        link: str,
+        limiter: HostLimiter,
+        headers: dict | None = None,
+        cache: HttpCache | None = None,
+        cache_ttl: int = 0,
+        retrier: Retrier | None = None,
+        source: str = ''
+        ) -> tuple[int | None, str]:
+    """Запрашивает страницу с подробными данными, возвращает статус код и текст.
+    Если есть кэш, свежая страница берется из него без запроса, а устаревшая
+    запрашивается с условными заголовками и при 304 тоже берется из кэша.
+    Ошибки и перегрузку хоста повторяет retrier, он же дублирует медленные запросы.
+    Полученные байты идут в метрики источника source"""
+    # кэш - файл sqlite, обращения к нему не должны останавливать цикл событий
+    cached = await asyncio.to_thread(cache.lookup, link) if cache is not None else None
+    if cached is not None and cached.is_fresh(cache_ttl):
+        cache.hits += 1
+        return 200, cached.body
+    if cached is not None:
+        headers = {**(headers or {}), **cached.conditional_headers()}
+    # асинхронный запрос страницы, каждая попытка - когда позволит ограничитель.
+    # Ему же retrier сообщает, как хост ответил, чтобы он подстроил скорость
+    async def request() -> tuple[int, tuple[str, CIMultiDictProxy]]:
+        async with session.get(link, headers=headers, allow_redirects=False, timeout=Vacancy.client_timeout()) as response:
+            metrics.add_bytes(source, len(await response.read()))
+            return response.status, (await response.text(), response.headers)
+    status, (page, response_headers) = await (retrier or Vacancy.retrier()).call(request, limiter, hedge=True)
+    if cache is not None:
+        # страница не менялась
+        if status == 304 and cached is not None:
+            cache.revalidated += 1
+            await asyncio.to_thread(cache.refresh, link)
+            return 200, cached.body
+        cache.misses += 1
+        if status == 200:
+            await asyncio.to_thread(cache.store, link, page, response_headers.get('ETag'), response_headers.get('Last-Modified'))
+    return status, page
+
+async def get_one_vacancy(
+        session: aiohttp.ClientSession,
+        queue: asyncio.Queue,
+        limiter: HostLimiter,
+        headers: dict | None = None,
+        cache: HttpCache | None = None,
+        cache_ttl: int = 0,
+        retrier: Retrier | None = None
+        ) -> None:
+    """Запрашивает и парсит полные данные по частично заполненной вакансии,
+    не возвращает ничего, т.к. дописывает в класс. headers источника
+    передаются с каждым запросом, сессия может быть общей. Частоту и
+    количество одновременных запросов к хосту определяет limiter,
+    уже виденные страницы по возможности берутся из cache, а неудачные
+    запросы повторяет retrier. Время запросов, разбора и занятости
+    потребителя идет в метрики"""
+    while True:
+        # запрос элемента класса Vacancy из очереди
+        one_vacancy = await queue.get()
+        source = one_vacancy.source_type
+        metrics.sample_queue(source, queue.qsize())
+        taken = perf_counter()
+        try:
+            link = one_vacancy.detail_link()
+            with metrics.timer(source, 'detail_fetch'):
+                status, page = await fetch_detail(session, link, limiter, headers, cache, cache_ttl, retrier, source)
+            # если ничего не получили, нечего обрабатывать
+            if one_vacancy.bad_status_code(status, f'get_one_vacancy | source type is {one_vacancy.source_type}'):
+                continue
+            # в зависимости от источника ищем разные элементы страницы
+            # разбор - в пуле, пока цикл событий занят другими запросами
+            details, waited, parsed = await Vacancy.parse_pool().run(Vacancy._parse_detail_on, Vacancy.date_now, source, page, link)
+            metrics.add_time(source, 'parse_wait', waited)
+            metrics.add_time(source, 'detail_parse', parsed)
+            if details is None:
+                continue
+            for field, value in details.items():
+                setattr(one_vacancy, field, value)
+        except Exception:
+            logger.warning(f'Для вакансии {one_vacancy.link} не удалось получить подробных данных', exc_info=True)
+        finally:
+            # поскольку дата нужна для записи в БД, то в случае неполучения данных по вакансии
+            # (плохой статус, ошибка после всех повторов, пустая страница), нужно недостающее заполнить
+            if not one_vacancy.date:
+                one_vacancy.date = one_vacancy.date_now
+            metrics.add_busy(source, perf_counter() - taken)
+            # отмечаем задачу сделанной
+            queue.task_done()
+
+async def proccess_worker(
+        method: Callable,
+        days: int,
+        session: aiohttp.ClientSession | None = None,
+        known_links: Callable[[list[Vacancy]], Awaitable[set[str]]] | None = None,
+        cache: HttpCache | None = None,
+        stats: ConnectionStats | None = None
+        ) -> list[Vacancy] | None:
+    """Собирает все данные одного источника. Асинхронный вариант method
+    выступает производителем - каждая вакансия уходит в очередь сразу
+    после разбора страницы списка, а потребители в той же сессии
+    параллельно собирают по ним все оставшиеся данные. Если сессия не
+    передана (отдельный процесс на источник) - создает свою. Вакансии,
+    чьи ссылки known_links вернет для страницы списка, уже есть в бд - они
+    пропускаются целиком, без запроса подробных данных. Страницы подробных данных
+    кэшируются в cache, если он передан. Соединения своей сессии считает
+    stats, если передан. Общее время источника, длина очереди и занятость
+    потребителей идут в метрики"""
+    if session is None:
+        async with client_session(stats) as session:
+            return await proccess_worker(method, days, session, known_links, cache)
+    vacancy_list = []
+    skipped = 0
+    # имя источника в метриках, как source_type его вакансий
+    source = method.__name__.split('_')[1]
+    started = perf_counter()
+    # ограниченная очередь: потребители ограничивают количество одновременных
+    # запросов, а размер очереди - насколько разбор списка может убежать вперед
+    queue = asyncio.Queue(maxsize=Vacancy.detail_queue_size)
+    # у каждого источника свой хост с подробными данными, ограничитель для него
+    limiter = HostLimiter(**Vacancy.detail_limits[method.__name__])
+    # повторы общие на списки и подробные данные, бюджет - на весь источник
+    retrier = Vacancy.retrier()
+    # создаем потребителей - корутины которые почти одновременно будут ожидать
+    # ответа. Сколько из них реально шлют запросы, решает ограничитель.
+    # headers берутся по имени метода, либо None
+    consumers = [
+        asyncio.create_task(get_one_vacancy(
+            session, queue, limiter, Vacancy.headers.get(method.__name__), cache, Vacancy.detail_cache_ttl[method.__name__], retrier
+        ))
+        for _ in range(limiter.max_concurrency)
+    ]
+    try:
+        # наполняем очередь по мере получения списка вакансий. Известные бд
+        # ссылки выясняются одним запросом на всю страницу списка
+        async for page in getattr(Vacancy, f'{method.__name__}_async')(session, days, retrier):
+            known = await known_links(page) if known_links is not None else set()
+            for item in page:
+                if item.link in known:
+                    skipped += 1
+                    continue
+                vacancy_list.append(item)
+                await queue.put(item)
+                metrics.sample_queue(source, queue.qsize())
+        logger.info(f'Получен список из {len(vacancy_list) + skipped} вакансий, из них {skipped} уже есть в бд')
+        # ждем пока все задания в очереди будут готовы
+        await queue.join()
+        logger.info(f'Подробные данные получены, {limiter}, {retrier}')
+    finally:
+        # завершаем все потребители, т.к. они стоят на бесконечном цикле ожидания
+        # новых данных из очереди
+        for task in consumers:
+            task.cancel()
+        wall = perf_counter() - started
+        metrics.set_workers(source, len(consumers), wall)
+        metrics.add_time(source, 'total', wall)
+    return vacancy_list
+
+async def orchestrator(days: int, session: Session, verify: bool, incremental: bool, cache: HttpCache | None) -> None:
+    """Однопроцессный режим: все источники работают задачами одного
+    цикла событий в общей http сессии. В бд пишет и на экран выводит
+    только эта корутина, по мере готовности источников, так что ни
+    блокировка консоли, ни передача сессии бд в другие процессы не нужны.
+    Сама работа с бд идет в потоке DbThread, чтобы запись с кластерами не
+    останавливала запросы остальных источников.
+    При incremental уже известные по бд вакансии не запрашиваются"""
+    db = DbThread(session)
+    known_links = partial(db.run, links_known) if incremental else None
+    stats = ConnectionStats()
+    async with client_session(stats) as http_session:
+        tasks = [ asyncio.create_task(proccess_worker(method, days, http_session, known_links, cache)) for method in Vacancy.methods() ]
+        try:
+            async with asyncio.timeout(Vacancy.source_timeout):
+                for finished in asyncio.as_completed(tasks):
+                    # ошибка одного источника не должна мешать остальным
+                    try:
+                        result = await finished
+                    except Exception:
+                        logger.exception('Источник завершился с ошибкой')
+                        continue
+                    # прогон через бд и вывод в консоль. Список вакансий после
+                    # записи не нужен, в выводе его место занимают строки бд.
+                    # Ошибка записи или вывода тоже касается только этого источника
+                    source = result[0].source_type if result else None
+                    try:
+                        result = latest_by_cluster(await db.run(db_writer, result, verify=verify))
+                        table_writer(result, source=source)
+                    except Exception:
+                        await db.rollback()
+                        logger.exception(f'Запись или вывод вакансий {source} завершились с ошибкой')
+        except TimeoutError:
+            logger.warning(f'Не все источники уложились в {Vacancy.source_timeout} секунд')
+        finally:
+            for task in tasks:
+                task.cancel()
+            # отмененные источники должны успеть закрыть свои запросы и
+            # вернуть места ограничителям до того, как закроется пул разбора
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # запись, чье ожидание отменено по таймауту, дорабатывает в потоке
+            db.close()
+            logger.info(f'Соединения: {stats}')
+            if (sync_stats := Vacancy.http_stats()) is not None:
+                logger.info(f'Соединения requests: {sync_stats}')
+            logger.info(f'Разбор дат: {Vacancy.date_parser}')
+            logger.info(f'Бд: {db}')
+            Vacancy.close_parse_pool()
+
+def command_sink(command: str) -> Callable[[list[dict]], None]:
+    """Сток новых вакансий для режима наблюдения, который вызывает command
+    на каждую вакансию - например notify-send. Команде передаются два
+    аргумента: название и строка с компанией, зарплатой и ссылкой"""
+    arguments = shlex.split(command)
+    def sink(vacancies: list[dict]) -> None:
+        for vacancy in vacancies:
+            body = ' '.join(filter(None, (vacancy.get('company'), vacancy.get('salary')))) + f'\n{vacancy["link"]}'
+            try:
+                subprocess.run([*arguments, vacancy['title'], body], timeout=30, check=True)
+            except (OSError, subprocess.SubprocessError):
+                logger.exception(f'Команда уведомления не отработала для вакансии {vacancy["link"]}')
+    return sink
+
+async def watch_source(
+        method: Callable,
+        interval: float,
+        http_session: aiohttp.ClientSession,
+        db: DbThread,
+        sink: Callable[[list[dict]], None],
+        sink_lock: asyncio.Lock,
+        verify: bool,
+        cache: HttpCache | None,
+        metrics_json: str | None = None,
+        metrics_prom: str | None = None
+        ) -> None:
+    """Опрашивает один источник раз в interval секунд, сдвигая каждый опрос
+    на случайную долю Vacancy.watch_jitter. Запрашиваются только вакансии,
+    которых нет в бд или которые изменились, а в sink уходят новые, кроме
+    перевыложенных, и те, у которых изменилась зарплата (_write_poll). Ошибка опроса не
+    останавливает наблюдение, источник просто опрашивается в свой срок.
+    Метрики каждого опроса пишутся в файлы, если они заданы"""
+    source = method.__name__.split('_')[1]
+    known_links = partial(db.run, links_known)
+    # первый опрос тоже сдвинут, чтобы источники не стартовали разом
+    await asyncio.sleep(uniform(0, interval * Vacancy.watch_jitter))
+    while True:
+        started = monotonic()
+        # день мог смениться, пока процесс работает
+        Vacancy.date_now = date.today()
+        metrics.forget(source)
+        try:
+            async with asyncio.timeout(Vacancy.source_timeout):
+                result = await proccess_worker(method, 1, http_session, known_links, cache)
+            fresh = await db.run(_write_poll, result, verify=verify)
+            logger.info(f'Опрос {source}: {len(result)} вакансий, из них новых {len(fresh)}')
+            if fresh:
+                async with sink_lock:
+                    await asyncio.to_thread(sink, latest_by_cluster(fresh))
+        except Exception:
+            await db.rollback()
+            logger.exception(f'Опрос {source} завершился с ошибкой')
+        if metrics_json:
+            metrics.write_json(metrics_json, source)
+        if metrics_prom:
+            metrics.write_prometheus(metrics_prom)
+        delay = interval * uniform(1 - Vacancy.watch_jitter, 1 + Vacancy.watch_jitter)
+        await asyncio.sleep(max(0, delay - (monotonic() - started)))
+
+def _write_poll(result: list[Vacancy], session: Session, verify: bool) -> list[dict]:
+    """Записывает вакансии одного опроса и отдает те, о которых нужно сообщить.
+    Новая вакансия сообщается, если её кластера в бд еще не было, - иначе это
+    перевыложенная. Вакансия, чья ссылка уже есть в бд, запрашивается заново,
+    только если в списке изменились зарплата или дата, и сообщается, если
+    изменилась зарплата. Смена одной даты - то же перевыкладывание"""
+    # все, что до этого id, было в бд до опроса
+    last_known = session.scalar(select(func.max(VacancyDB.id))) or 0
+    stored = latest_stored({ item.link for item in result }, session)
+    fresh = []
+    for row in db_writer(result, session, verify):
+        # id есть только у строк, записанных этим опросом
+        if 'id' not in row:
+            continue
+        if (previous := stored.get(row['link'])) is not None:
+            # к строкам, как и в links_known
+            if str(row['salary']) != str(previous.salary):
+                fresh.append(row)
+        elif not row.get('cluster_id') or row['cluster_id'] > last_known:
+            fresh.append(row)
+    # бд не должна держать открытой читающую транзакцию до следующего опроса
+    session.commit()
+    return fresh
+
+async def watcher(
+        session: Session,
+        sink: Callable[[list[dict]], None],
+        verify: bool,
+        cache: HttpCache | None,
+        interval: float | None = None,
+        metrics_json: str | None = None,
+        metrics_prom: str | None = None
+        ) -> None:
+    """Режим наблюдения: процесс не завершается, а опрашивает каждый
+    источник по своему расписанию. http сессия с открытыми соединениями,
+    подключение к бд и кэш живут все время работы, так что опрос стоит
+    только запросов к сайтам. interval, если задан, - общий для всех
+    источников вместо Vacancy.watch_intervals. Останавливается по Ctrl+C
+    или SIGTERM"""
+    stats = ConnectionStats()
+    sink_lock = asyncio.Lock()
+    # сессия бд одна на все источники, работа с ней - в одном потоке
+    db = DbThread(session)
+    # по SIGTERM завершаемся так же, как по Ctrl+C
+    current = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, current.cancel)
+    async with client_session(stats) as http_session:
+        tasks = [
+            asyncio.create_task(watch_source(
+                method, interval or Vacancy.watch_intervals[method.__name__], http_session, db, sink, sink_lock,
+                verify, cache, metrics_json, metrics_prom
+            ))
+            for method in Vacancy.methods()
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            logger.info('Наблюдение остановлено')
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            db.close()
+            logger.info(f'Соединения: {stats}')
+            if (sync_stats := Vacancy.http_stats()) is not None:
+                logger.info(f'Соединения requests: {sync_stats}')
+            logger.info(f'Разбор дат: {Vacancy.date_parser}')
+            logger.info(f'Бд: {db}')
+            Vacancy.close_parse_pool()
+
+def process_starter(
+        method: Callable,
+        days: int,
+        console: Lock,
+        bd_file: str,
+        verify: bool,
+        incremental: bool,
+        use_cache: bool,
+        metrics_queue: Queue
+        ) -> None:
+    """Нужна только для того, чтобы запустить асинхронную
+    корутину на выполнение. Заодно занимается записью в бд
+    и выводом результата. Подключение к бд создается уже
+    внутри процесса, передавать его через fork небезопасно.
+    Метрики процесса по завершении уходят в metrics_queue"""
+    try:
+        _process_source(method, days, console, bd_file, verify, incremental, use_cache)
+    finally:
+        metrics_queue.put(metrics.snapshot())
+
+def _process_source(method: Callable, days: int, console: Lock, bd_file: str, verify: bool, incremental: bool, use_cache: bool) -> None:
+    # кэш тоже открывается в каждом процессе свой, с файлом они разберутся сами
+    cache = HttpCache() if use_cache else None
+    stats = ConnectionStats()
+    with Session(db_engine(bd_file)) as session:
+        # получение данных с сайта
+        try:
+            result = asyncio.run(proccess_worker(
+                method, days, known_links=partial(asyncio.to_thread, links_known, session=session) if incremental else None,
+                cache=cache, stats=stats
+            ))
+        finally:
+            Vacancy.close_parse_pool()
+        logger.info(f'Соединения: {stats}')
+        if (sync_stats := Vacancy.http_stats()) is not None:
+            logger.info(f'Соединения requests: {sync_stats}')
+        logger.info(f'Разбор дат: {Vacancy.date_parser}')
+        # прогон через бд
+        result = db_writer(result, session, verify)
+    if cache is not None:
+        logger.info(f'Кэш страниц: {cache}')
+        cache.close()
+    # вывод в консоль
+    # захват консоли
+    console.acquire()
+    table_writer(latest_by_cluster(result), source=method.__name__.split('_')[1])
+    # отдаем консоль
+    console.release()